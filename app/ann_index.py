@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import numpy as np
+import faiss
+
+# Shared by the build scripts (data_creation/tdsembedder.py, iemb.py), the API
+# and benchmarks/ann_benchmark.py. Build parameters are stored next to the index
+# in <index>.params.json so the server knows what it loaded.
+INDEX_TYPES = ("flat", "ivfflat", "ivfpq", "hnsw")
+
+def default_nlist(n):
+    # ~4*sqrt(N) lists, but keep >= 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+def build_index(vectors, index_type="flat", nlist=None, pq_m=32, pq_nbits=8,
+                hnsw_m=32, ef_construction=200, nprobe=None, ef_search=64, ids=None):
+    """
+    Builds (and trains, if needed) an L2 index of the given type over vectors.
+    With ids, the index is wrapped in an IndexIDMap2 so search returns those
+    stable ids instead of positions. Returns the index and the parameters used,
+    for params.json.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    params = {"index_type": index_type, "dim": dim, "ntotal": n}
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type in ("ivfflat", "ivfpq"):
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivfflat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide dim={dim}")
+            # Each PQ codebook wants ~39 training points per centroid
+            pq_nbits = min(pq_nbits, max(1, int(math.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+            params.update({"pq_m": pq_m, "pq_nbits": pq_nbits})
+        index.train(vectors)
+        nprobe = nprobe or max(1, nlist // 8)
+        index.nprobe = nprobe
+        params.update({"nlist": nlist, "nprobe": nprobe})
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+        params.update({"hnsw_m": hnsw_m, "ef_construction": ef_construction, "ef_search": ef_search})
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    if ids is None:
+        index.add(vectors)
+    else:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+        params["id_mapped"] = True
+    return index, params
+
+def unwrap_index(index):
+    """
+    Returns the underlying index of an IndexIDMap/IndexIDMap2, downcast to its real type.
+    """
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def index_ids(index):
+    """
+    Stable ids held by an ID-mapped index, or None for a positional one.
+    """
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map)
+    return None
+
+def params_path(index_path):
+    return os.path.splitext(index_path)[0] + ".params.json"
+
+def save_index(index, index_path, params):
+    faiss.write_index(index, index_path)
+    with open(params_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+def load_params(index_path):
+    path = params_path(index_path)
+    if not os.path.exists(path):
+        return {"index_type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def apply_search_params(index, nprobe=None, ef_search=None):
+    """
+    Sets search-time knobs on whichever index type this is; ignores the ones that don't apply.
+    """
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = int(nprobe)
+        except RuntimeError:
+            pass
+    if ef_search:
+        hnsw_index = unwrap_index(index)
+        if hasattr(hnsw_index, "hnsw"):
+            hnsw_index.hnsw.efSearch = int(ef_search)
+    return index
+
+def reconstruct_all(index):
+    """
+    Returns the stored vectors of a flat index as an (N, dim) float32 array
+    (in insertion order, also for an ID-mapped flat index).
+    """
+    return unwrap_index(index).reconstruct_n(0, index.ntotal)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import faiss
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers. Past question embeddings live in a small
+    inner-product FAISS index; a lookup hits when a past question is at least
+    `threshold` cosine-similar AND was answered from exactly the same chunks.
+    Lookups and stores carry the version of the vector store being served; a
+    new version (the index was rebuilt and reloaded) drops every entry.
+    """
+    def __init__(self, dim, threshold=0.95, max_entries=2000, ttl=None, candidates=5):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.candidates = candidates
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()  # id -> {"context_key", "answer", "created"}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _prepare(self, embedding):
+        vec = np.array(embedding, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _remove(self, entry_id):
+        self._index.remove_ids(np.array([entry_id], dtype="int64"))
+        self._entries.pop(entry_id, None)
+
+    def _clear(self):
+        self._index.reset()
+        self._entries.clear()
+
+    def check_version(self, version):
+        """
+        Drops every entry when the vector store the answers were built from changes.
+        """
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def lookup(self, embedding, context_key, version=None):
+        vec = self._prepare(embedding)
+        if version is not None:
+            self.check_version(version)
+        with self._lock:
+            if self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            sims, ids = self._index.search(vec, min(self.candidates, self._index.ntotal))
+            for sim, entry_id in zip(sims[0], ids[0]):
+                if entry_id < 0 or sim < self.threshold:
+                    break
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if self.ttl and time.time() - entry["created"] > self.ttl:
+                    self._remove(int(entry_id))
+                    continue
+                if entry["context_key"] == context_key:
+                    self._entries.move_to_end(int(entry_id))
+                    self.hits += 1
+                    return entry["answer"]
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding, context_key, answer, version=None):
+        """
+        Skipped when the vector store changed since `version` was looked up.
+        """
+        vec = self._prepare(embedding)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {
+                "context_key": context_key,
+                "answer": answer,
+                "created": time.time()
+            }
+            # Evict least recently used answers
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,119 @@
+import json
+import os
+import re
+import sys
+import numpy as np
+
+# Array-backed BM25 index over the same chunks (and row order) as tds_index.faiss.
+#
+# Postings are stored CSR-style: for term t, docs[offsets[t]:offsets[t+1]] are the
+# rows containing it and weights[...] their precomputed BM25 term scores, so a
+# query is a few slice-adds into one score array.
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+def bm25_document(meta):
+    """
+    Text indexed for one metadata row: title (or source file) plus the chunk.
+    """
+    return f"{meta.get('title') or meta.get('source', '')}\n{meta.get('text', '')}"
+
+class BM25Index:
+    def __init__(self, vocab, offsets, docs, weights, num_docs):
+        self.vocab = vocab  # term -> term id
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts, k1=1.2, b=0.75):
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(len(texts), dtype="float32")
+
+        for doc_id, text in enumerate(texts):
+            counts = {}
+            tokens = tokenize(text)
+            for tok in tokens:
+                tid = vocab.setdefault(tok, len(vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            doc_len[doc_id] = len(tokens)
+            term_ids.extend(counts.keys())
+            doc_ids.extend([doc_id] * len(counts))
+            tfs.extend(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype="int64")
+        doc_ids = np.asarray(doc_ids, dtype="int32")
+        tfs = np.asarray(tfs, dtype="float32")
+
+        # Group postings by term (stable, so doc ids stay ascending within a term)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype="int64")
+        np.cumsum(df, out=offsets[1:])
+
+        n = len(texts)
+        avgdl = float(doc_len.mean()) if n else 0.0
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype("float32")
+        norm = k1 * (1.0 - b + b * doc_len[doc_ids] / max(avgdl, 1e-9))
+        weights = (idf[term_ids] * tfs * (k1 + 1.0) / (tfs + norm)).astype("float32")
+
+        return cls(vocab, offsets, doc_ids, weights, n)
+
+    def save(self, path):
+        # Terms as one newline-joined UTF-8 blob (tokens never contain newlines)
+        terms = "\n".join(sorted(self.vocab, key=self.vocab.get)).encode("utf-8")
+        np.savez(path, terms=np.frombuffer(terms, dtype="uint8"), offsets=self.offsets, docs=self.docs,
+                 weights=self.weights, num_docs=np.int64(self.num_docs))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        terms = data["terms"].tobytes().decode("utf-8").split("\n")
+        vocab = {term: i for i, term in enumerate(terms)}
+        return cls(vocab, data["offsets"], data["docs"], data["weights"], int(data["num_docs"]))
+
+    def search(self, query, k=10):
+        """
+        Returns (row ids, scores) of the top-k rows, best first.
+        """
+        scores = np.zeros(self.num_docs, dtype="float32")
+        for tid in {self.vocab[t] for t in tokenize(query) if t in self.vocab}:
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            scores[self.docs[start:end]] += self.weights[start:end]
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return hits, scores[hits]
+
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """
+    Fuses several ranked lists of ids: score(id) = sum 1 / (k + rank).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda doc_id: -scores[doc_id])
+    return fused[:limit] if limit else fused
+
+if __name__ == "__main__":
+    # Build from existing metadata: python app/bm25.py app/vectorstore/tds_metadata.json [out.npz]
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(src), "tds_bm25.npz")
+    if src.endswith(".bin"):
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        from app.metadata_store import MetadataStore
+        rows = list(MetadataStore(src))
+    else:
+        with open(src, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    bm25 = BM25Index.build([bm25_document(row) for row in rows])
+    bm25.save(dst)
+    print(f"BM25 index over {bm25.num_docs} rows, {len(bm25.vocab)} terms saved to {dst}")
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class DiskTier:
+    """
+    Optional persistent tier for TTLCache, backed by a single SQLite file.
+    Values go through encode/decode so callers control the on-disk format.
+
+    set() only queues the entry: a writer thread encodes and commits queued
+    entries in batches, so callers on the event loop never wait for SQLite.
+    get() does block and is meant to run off the event loop (TTLCache.aget).
+    """
+    def __init__(self, path, encode, decode):
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self._connect()
+        # SQLite connections must not be shared across os.fork (app/serve.py)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()  # the connection
+        self._pending_lock = threading.Lock()
+        self._pending = {}  # key -> (value, created), not yet written
+        self._wake = threading.Event()
+        self._writer_pid = None  # the writer thread is started per process
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, created REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key, ttl):
+        with self._lock:
+            with self._pending_lock:
+                entry = self._pending.get(key)
+            if entry is not None:
+                return entry
+            row = self._conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        value, created = row
+        if ttl and time.time() - created > ttl:
+            self.delete(key)
+            return None, None
+        return self.decode(value), created
+
+    def set(self, key, value, created):
+        with self._pending_lock:
+            self._pending[key] = (value, created)
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._write_loop, name="disk-tier-writer", daemon=True).start()
+        self._wake.set()
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Disk cache write to {self.path} failed: {e}")
+
+    def flush(self):
+        """
+        Writes every queued entry with one commit.
+        """
+        with self._lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, created) VALUES (?, ?, ?)",
+                [(key, self.encode(value), created) for key, (value, created) in batch.items()]
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            with self._pending_lock:
+                self._pending.pop(key, None)
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def prune(self, ttl):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            with self._pending_lock:
+                self._pending = {}
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache with a per-entry TTL and hit/miss counters.
+    Misses fall through to an optional DiskTier, and disk hits are promoted to memory.
+    """
+    def __init__(self, max_entries=10000, ttl=None, disk=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, created)
+        self._lock = threading.Lock()
+        if disk is not None and ttl:
+            disk.prune(ttl)
+
+    def _expired(self, created):
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+        return None
+
+    def _get_disk(self, key):
+        if self.disk is not None:
+            value, created = self.disk.get(key, self.ttl)
+            if value is not None:
+                with self._lock:
+                    self._put(key, value, created)
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key):
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        return self._get_disk(key)
+
+    async def aget(self, key):
+        """
+        get() for the event loop: a disk lookup runs on a worker thread.
+        """
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return self._get_disk(key)  # counts the miss
+        return await asyncio.to_thread(self._get_disk, key)
+
+    async def aget_many(self, keys):
+        """
+        aget() for several keys, with one worker thread hop for all disk lookups.
+        """
+        values = [self._get_memory(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            if self.disk is None:
+                found = [self._get_disk(keys[i]) for i in missing]
+            else:
+                found = await asyncio.to_thread(lambda: [self._get_disk(keys[i]) for i in missing])
+            for i, value in zip(missing, found):
+                values[i] = value
+        return values
+
+    def _put(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._put(key, value, created)
+        if self.disk is not None:
+            self.disk.set(key, value, created)  # queued, doesn't block
+
+    def flush(self):
+        if self.disk is not None:
+            self.disk.flush()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,152 @@
+import glob
+import json
+import mmap
+import os
+import sys
+
+# Chunk files as JSONL shards (replaces one big pretty-printed JSON array).
+#
+# A chunk set is a directory of part-00000.jsonl, part-00001.jsonl, ... with one
+# compact JSON object per line. Readers stream them line by line, or map them and
+# keep (shard, start, end) byte offsets so single chunks can be decoded on demand.
+# A legacy .json array is still accepted everywhere (it is loaded in full).
+SHARD_PATTERN = "part-*.jsonl"
+SHARD_MAX_LINES = 5000
+
+def shard_name(number):
+    return f"part-{number:05d}.jsonl"
+
+def encode_chunk(chunk):
+    return json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def resolve_chunks_path(shard_dir, legacy_file):
+    """
+    The shard directory if it has been written, else the legacy JSON file.
+    """
+    if os.path.isdir(shard_dir) and shard_files(shard_dir):
+        return shard_dir
+    return legacy_file
+
+def shard_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, SHARD_PATTERN)))
+    return [path]
+
+def iter_chunks(path):
+    """
+    Yields chunk dicts one at a time; only a legacy .json file is read whole.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    for shard in shard_files(path):
+        with open(shard, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+class ShardWriter:
+    """
+    Writes encoded chunk lines into numbered shards under out_dir. A shard is only
+    rolled over between groups (see end_group), so one source file's chunks never
+    straddle two shards.
+    """
+    def __init__(self, out_dir, max_lines=SHARD_MAX_LINES):
+        self.out_dir = out_dir
+        self.max_lines = max_lines
+        self.shards = 0
+        self.lines = 0
+        self.total = 0
+        self._file = None
+        self._lines_in_shard = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open(self):
+        self._file = open(os.path.join(self.out_dir, shard_name(self.shards)), "wb")
+        self.shards += 1
+        self._lines_in_shard = 0
+
+    def write_lines(self, blob, count):
+        """
+        Appends `count` already-encoded lines; returns (shard, start, end) of the span.
+        """
+        if self._file is None:
+            self._open()
+        start = self._file.tell()
+        self._file.write(blob)
+        self._lines_in_shard += count
+        self.total += count
+        return os.path.basename(self._file.name), start, self._file.tell()
+
+    def write(self, chunk):
+        return self.write_lines(encode_chunk(chunk), 1)
+
+    def end_group(self):
+        if self._file is not None and self._lines_in_shard >= self.max_lines:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return self.total
+
+class ChunkReader:
+    """
+    Random access to the chunks of a shard directory through memory-mapped shards.
+    refs() yields (ref, chunk) once; read(ref) decodes just that chunk later.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._maps = []
+        self._files = []
+        self._rows = None
+        if path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                self._rows = json.load(f)
+            return
+        for shard in shard_files(path):
+            f = open(shard, "rb")
+            self._files.append(f)
+            self._maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(shard) else b"")
+
+    def refs(self):
+        if self._rows is not None:
+            yield from enumerate(self._rows)
+            return
+        for shard, mm in enumerate(self._maps):
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                end = size if end < 0 else end + 1
+                line = mm[start:end]
+                if line.strip():
+                    yield (shard, start, end), json.loads(line)
+                start = end
+
+    def read(self, ref):
+        if self._rows is not None:
+            return self._rows[ref]
+        shard, start, end = ref
+        return json.loads(self._maps[shard][start:end])
+
+    def close(self):
+        for mm in self._maps:
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        for f in self._files:
+            f.close()
+        self._maps, self._files = [], []
+
+if __name__ == "__main__":
+    # Convert a JSON chunk array to shards: python app/chunk_io.py in.json [out_dir]
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0]
+    writer = ShardWriter(dst)
+    for chunk in iter_chunks(src):
+        writer.write(chunk)
+        writer.end_group()
+    print(f"Wrote {writer.close()} chunks to {writer.shards} shard(s) in {dst}")
@@ -0,0 +1,137 @@
+import argparse
+import os
+import numpy as np
+from PIL import Image
+
+# CLIP image encoders for serving, selected with CLIP_BACKEND:
+#   torch - the float open_clip model (what the image index was built with)
+#   int8  - the same model with its Linear layers dynamically quantized to int8
+#   onnx  - an ONNX export of the image tower run by onnxruntime; needs neither
+#           torch nor open_clip at serving time. Create it with
+#           python -m app.clip_encoder export [--int8]
+# All of them return unnormalized (1, 512) float32 embeddings, like encode_image,
+# so they search tds_imageembeddings.faiss as is. benchmarks/clip_parity.py checks
+# that their nearest neighbours match the float model's and compares latency.
+
+CLIP_MODEL = "ViT-B-32"
+CLIP_PRETRAINED = "openai"
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+CLIP_ONNX_PATH = os.getenv("CLIP_ONNX_PATH", "models/clip-vit-b-32-visual.onnx")
+
+# open_clip's preprocessing for the OpenAI weights
+IMAGE_SIZE = 224
+MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype="float32")
+STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype="float32")
+
+def preprocess_image(image):
+    """
+    NumPy version of open_clip's transform (resize the short side with bicubic,
+    center crop, scale, normalize). Returns a (3, 224, 224) float32 array.
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    short, long = min(width, height), max(width, height)
+    new_long = int(IMAGE_SIZE * long / short)
+    size = (IMAGE_SIZE, new_long) if width <= height else (new_long, IMAGE_SIZE)
+    image = image.resize(size, Image.Resampling.BICUBIC)
+    left = int(round((size[0] - IMAGE_SIZE) / 2.0))
+    top = int(round((size[1] - IMAGE_SIZE) / 2.0))
+    image = image.crop((left, top, left + IMAGE_SIZE, top + IMAGE_SIZE))
+    pixels = np.asarray(image, dtype="float32") / 255.0
+    return np.ascontiguousarray(((pixels - MEAN) / STD).transpose(2, 0, 1))
+
+def _load_open_clip():
+    import open_clip
+    model, _, preprocess = open_clip.create_model_and_transforms(CLIP_MODEL, pretrained=CLIP_PRETRAINED)
+    model.eval()
+    return model, preprocess
+
+class TorchClipEncoder:
+    def __init__(self, quantize=False, threads=0):
+        import torch
+        self.torch = torch
+        self.threads = threads
+        self._threads_pid = None
+        self.model, self.preprocess = _load_open_clip()
+        if quantize:
+            # Only nn.Linear (the MLP and projection weights) is quantized; the
+            # attention's out_proj is exempt by design in torch
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, image):
+        # Thread count is applied in the process that runs inference, so a model
+        # loaded before os.fork (app/serve.py) gets its pool in each worker
+        if self.threads and self._threads_pid != os.getpid():
+            self.torch.set_num_threads(self.threads)
+            self._threads_pid = os.getpid()
+        with self.torch.no_grad():
+            processed = self.preprocess(image).unsqueeze(0)
+            return self.model.encode_image(processed).cpu().numpy().astype("float32")
+
+class OnnxClipEncoder:
+    def __init__(self, path=CLIP_ONNX_PATH, threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def encode(self, image):
+        pixels = preprocess_image(image)[None]
+        return self.session.run(None, {self.input_name: pixels})[0].astype("float32")
+
+def load_clip_encoder(backend=CLIP_BACKEND, threads=0, onnx_path=CLIP_ONNX_PATH):
+    """
+    threads caps intra-op threads per forward pass (0 keeps the library default).
+    """
+    if backend == "torch":
+        return TorchClipEncoder(threads=threads)
+    if backend == "int8":
+        return TorchClipEncoder(quantize=True, threads=threads)
+    if backend == "onnx":
+        return OnnxClipEncoder(onnx_path, threads=threads)
+    raise ValueError(f"Unknown CLIP_BACKEND {backend!r} (expected torch, int8 or onnx)")
+
+def export_onnx(path=CLIP_ONNX_PATH, int8=False):
+    """
+    Exports the float image tower to ONNX (dynamic batch size); with int8, also
+    writes a dynamically quantized copy next to it. Returns the paths written.
+    """
+    import torch
+    model, _ = _load_open_clip()
+
+    class ImageTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixels):
+            return self.model.encode_image(pixels)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    dummy = torch.zeros(1, 3, IMAGE_SIZE, IMAGE_SIZE)
+    torch.onnx.export(
+        ImageTower().eval(), dummy, path,
+        input_names=["pixels"], output_names=["embedding"],
+        dynamic_axes={"pixels": {0: "batch"}, "embedding": {0: "batch"}},
+        opset_version=17
+    )
+    written = [path]
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.splitext(path)[0] + ".int8.onnx"
+        quantize_dynamic(path, int8_path, weight_type=QuantType.QInt8)
+        written.append(int8_path)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the CLIP image tower for CLIP_BACKEND=onnx")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--out", default=CLIP_ONNX_PATH)
+    parser.add_argument("--int8", action="store_true", help="also write a dynamically quantized *.int8.onnx")
+    args = parser.parse_args()
+    for written in export_onnx(args.out, args.int8):
+        print(f"✅ Wrote {written}")
@@ -0,0 +1,110 @@
+import os
+from app.vector_search import chunk_key
+
+# Turns retrieved chunks into the prompt context, within a token budget.
+#
+# Chunks are taken in priority order (search hits, then neighbours of the hits,
+# then image-matched topic chunks) until the budget is used up. The chosen chunks
+# are then merged into passages: runs of consecutive chunk_ids from the same url
+# become one passage, without the CHUNK_OVERLAP characters the chunkers repeat at
+# the start of every chunk.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_NEIGHBORS = int(os.getenv("CONTEXT_NEIGHBORS", "0"))  # chunks pulled in on each side of a hit
+CONTEXT_MAX_IMAGE_CHUNKS = int(os.getenv("CONTEXT_MAX_IMAGE_CHUNKS", "5"))  # across all matched topics
+
+# No tokenizer at serving time; ~4 characters per token holds for English text
+CHARS_PER_TOKEN = 4
+
+# The chunkers use chunk_overlap=100; the repeated text is looked for in this range
+MIN_OVERLAP_CHARS = 8
+MAX_OVERLAP_CHARS = 200
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def chunk_title(chunk):
+    return chunk.get("title", chunk.get("source", "Unknown"))
+
+def format_passage(title, text):
+    return f"Title: {title}\nChunk: {text}"
+
+def select_chunks(semantic_chunks, image_chunks, budget=CONTEXT_TOKEN_BUDGET, neighbors=CONTEXT_NEIGHBORS,
+                  max_image_chunks=CONTEXT_MAX_IMAGE_CHUNKS, neighbor_fn=None):
+    """
+    Returns the chunks that go into the prompt, in priority order, deduplicated
+    and within `budget` tokens. neighbor_fn(chunk, radius) -> [chunk] supplies
+    the chunks around a search hit when `neighbors` > 0; those come back as
+    copies marked "neighbor": True.
+    """
+    candidates = []
+    seen = set()
+
+    def add(chunk):
+        key = chunk_key(chunk)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(chunk)
+
+    for chunk in semantic_chunks:
+        add(chunk)
+    if neighbors and neighbor_fn is not None:
+        for chunk in list(candidates):
+            for neighbor in neighbor_fn(chunk, neighbors):
+                add(dict(neighbor, neighbor=True))
+    for chunk in image_chunks[:max_image_chunks]:
+        add(chunk)
+
+    # Costed as separate passages; merging adjacent ones only makes the prompt smaller
+    selected = []
+    used = 0
+    for chunk in candidates:
+        cost = estimate_tokens(format_passage(chunk_title(chunk), chunk["text"]))
+        if selected and used + cost > budget:
+            continue
+        selected.append(chunk)
+        used += cost
+    return selected
+
+def join_overlapping(first, second):
+    """
+    Concatenates two consecutive chunks, dropping the start of `second` that
+    repeats the end of `first`.
+    """
+    longest = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+def merge_passages(chunks):
+    """
+    Groups chunks into passages ({"url", "title", "chunk_ids", "text"}): each run
+    of consecutive chunk_ids from one url becomes a single passage in text order.
+    Passages are ordered by their best-ranked chunk.
+    """
+    by_url = {}
+    for rank, chunk in enumerate(chunks):
+        by_url.setdefault(chunk.get("url", ""), []).append((rank, chunk))
+
+    passages = []
+    for url, ranked in by_url.items():
+        ranked.sort(key=lambda item: item[1].get("chunk_id", -1))
+        passage = None
+        for rank, chunk in ranked:
+            chunk_id = chunk.get("chunk_id", -1)
+            if passage is not None and chunk_id >= 0 and chunk_id == passage["chunk_ids"][-1] + 1:
+                passage["text"] = join_overlapping(passage["text"], chunk["text"])
+                passage["chunk_ids"].append(chunk_id)
+                passage["rank"] = min(passage["rank"], rank)
+                continue
+            passage = {"url": url, "title": chunk_title(chunk), "chunk_ids": [chunk_id], "text": chunk["text"], "rank": rank}
+            passages.append(passage)
+
+    passages.sort(key=lambda passage: passage["rank"])
+    for passage in passages:
+        del passage["rank"]
+    return passages
+
+def format_context(passages):
+    return "\n\n".join(format_passage(passage["title"], passage["text"]) for passage in passages)
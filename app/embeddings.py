@@ -0,0 +1,131 @@
+from dotenv import load_dotenv
+import hashlib
+import os
+import unicodedata
+import numpy as np
+from app.http_client import get_client
+from app.cache import TTLCache, DiskTier
+from app.metrics import upstream_requests, stage
+from app.resources import lazy
+
+load_dotenv()
+
+# Same model/dimensionality the FAISS index was built with (see data_creation/tdsembedder.py)
+EMBED_MODEL = "nomic-embed-text-v1.5"
+DIMENSIONALITY = 256
+
+NOMIC_API_URL = os.getenv("NOMIC_API_URL", "https://api-atlas.nomic.ai/v1/embedding/text")
+NOMIC_API_KEY = os.getenv("NOMIC_API_KEY")
+
+# "nomic" calls the API; "local" runs the model on CPU (see app/local_embedder.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "nomic")
+
+# Query embedding cache: in-memory LRU + TTL, optionally persisted to a SQLite file
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")  # e.g. /tmp/embed_cache.sqlite
+
+def _encode_vector(vec):
+    return np.asarray(vec, dtype="float32").tobytes()
+
+def _decode_vector(blob):
+    return np.frombuffer(blob, dtype="float32")
+
+embedding_cache = TTLCache(
+    max_entries=EMBED_CACHE_SIZE,
+    ttl=EMBED_CACHE_TTL,
+    disk=DiskTier(EMBED_CACHE_PATH, _encode_vector, _decode_vector) if EMBED_CACHE_PATH else None
+)
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+# Local and API vectors are close but not identical, so a persisted cache keeps them apart
+EMBED_CACHE_MODEL = EMBED_MODEL
+if EMBED_BACKEND == "local":
+    from app.local_embedder import LOCAL_EMBED_MODEL_DIR
+    EMBED_CACHE_MODEL = f"{EMBED_MODEL}|local|{LOCAL_EMBED_MODEL_DIR}"
+
+def embedding_cache_key(text, task_type="search_query"):
+    raw = f"{EMBED_CACHE_MODEL}|{DIMENSIONALITY}|{task_type}|{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _load_local_batcher():
+    from app.local_embedder import LocalEmbedder, MicroBatcher
+    return MicroBatcher(LocalEmbedder(dimensionality=DIMENSIONALITY))
+
+# Only registered (and warmed up) when the local backend is selected
+local_batcher = lazy("local_embedder", _load_local_batcher, fork_safe=False) if EMBED_BACKEND == "local" else None
+
+async def embed_texts(texts, task_type="search_query"):
+    """
+    Embeds a list of texts with one call to the configured backend.
+    """
+    if local_batcher is not None:
+        with stage("local_embed"):
+            return list(await local_batcher.get().embed(texts, task_type))
+    return await _embed_texts_remote(texts, task_type)
+
+async def _embed_texts_remote(texts, task_type="search_query"):
+    """
+    Embeds a list of texts with one call to the Nomic embedding API.
+    """
+    headers = {
+        "Authorization": f"Bearer {NOMIC_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": EMBED_MODEL,
+        "texts": list(texts),
+        "task_type": task_type,
+        "dimensionality": DIMENSIONALITY
+    }
+
+    try:
+        response = await get_client().post(NOMIC_API_URL, headers=headers, json=payload)
+    except Exception:
+        upstream_requests.inc(service="nomic", status="error")
+        raise
+    upstream_requests.inc(service="nomic", status=response.status_code)
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+async def embed_query(text):
+    """
+    Embeds a search query, skipping the API round trip when the normalized
+    text was embedded recently.
+    """
+    key = embedding_cache_key(text)
+    cached = await embedding_cache.aget(key)
+    if cached is not None:
+        return cached
+
+    embeddings = await embed_texts([normalize_text(text)], task_type="search_query")
+    vec = np.asarray(embeddings[0], dtype="float32")
+    embedding_cache.set(key, vec)
+    return vec
+
+async def embed_queries(texts):
+    """
+    Embeds many search queries with a single API call for all cache misses.
+    Returns one vector per text, in order.
+    """
+    keys = [embedding_cache_key(text) for text in texts]
+    vectors = await embedding_cache.aget_many(keys)
+
+    missing = {}
+    for i, (key, vec) in enumerate(zip(keys, vectors)):
+        if vec is None:
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        miss_keys = list(missing)
+        miss_texts = [normalize_text(texts[missing[key][0]]) for key in miss_keys]
+        embeddings = await embed_texts(miss_texts, task_type="search_query")
+        for key, emb in zip(miss_keys, embeddings):
+            vec = np.asarray(emb, dtype="float32")
+            embedding_cache.set(key, vec)
+            for i in missing[key]:
+                vectors[i] = vec
+
+    return vectors
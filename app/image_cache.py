@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import numpy as np
+from app.cache import TTLCache, DiskTier
+
+# Image results keyed by a hash of the uploaded (base64-decoded) bytes, so a
+# re-uploaded screenshot skips PIL decode, OCR, CLIP and the image search.
+#
+# An entry holds the OCR result, the CLIP embedding and the topic ids found for
+# it, plus the image index version those ids came from: after the image index is
+# rebuilt, the stored embedding is searched again instead of re-running CLIP.
+# OCR and CLIP settings go into the key, so changing them never serves stale text.
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1") == "1"
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "2000"))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH")  # e.g. /tmp/image_cache.sqlite
+
+# OCR outcomes that depend on load rather than on the image aren't worth keeping
+UNCACHEABLE_OCR = {"busy", "timeout", "error"}
+
+def _encode_entry(entry):
+    # JSON header, NUL, raw float32 embedding (JSON never contains a raw NUL byte)
+    header = {name: value for name, value in entry.items() if name != "embedding"}
+    return json.dumps(header).encode("utf-8") + b"\0" + np.asarray(entry["embedding"], dtype="float32").tobytes()
+
+def _decode_entry(blob):
+    header, _, vector = bytes(blob).partition(b"\0")
+    entry = json.loads(header)
+    entry["embedding"] = np.frombuffer(vector, dtype="float32").reshape(1, -1)
+    return entry
+
+image_cache = TTLCache(
+    max_entries=IMAGE_CACHE_SIZE,
+    ttl=IMAGE_CACHE_TTL,
+    disk=DiskTier(IMAGE_CACHE_PATH, _encode_entry, _decode_entry) if IMAGE_CACHE_PATH else None
+)
+
+def image_cache_key(data, settings=""):
+    """
+    sha256 over the settings that shape the results, then the image bytes.
+    """
+    h = hashlib.sha256(settings.encode("utf-8"))
+    h.update(data)
+    return h.hexdigest()
+
+def lookup(key):
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    return image_cache.get(key)
+
+def store(key, ocr_result, embedding, topic_ids, index_version):
+    """
+    Caches one image's results; skipped when OCR gave up for reasons unrelated
+    to the image, so the next upload gets a proper attempt.
+    """
+    if not IMAGE_CACHE_ENABLED or ocr_result["status"] in UNCACHEABLE_OCR:
+        return
+    image_cache.set(key, {
+        "ocr": {"text": ocr_result["text"], "status": ocr_result["status"], "size": ocr_result["size"]},
+        "embedding": np.asarray(embedding, dtype="float32").reshape(1, -1),
+        "topic_ids": list(topic_ids),
+        "index_version": index_version
+    })
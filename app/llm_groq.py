@@ -1,13 +1,17 @@
+import json
 import requests
+import httpx
 from dotenv import load_dotenv
 import os
+from app.http_client import get_client
+from app.metrics import upstream_requests
 
 load_dotenv()
 
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
+API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 API_KEY=os.getenv("GROQ_API_KEY")
 
-def query_groq_mistral(system_msg, user_msg):
+def _build_request(system_msg, user_msg):
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json"
@@ -22,11 +26,14 @@ def query_groq_mistral(system_msg, user_msg):
         "temperature": 0.7,
         "max_tokens": 1024  # ✅ Add this explicitly!
     }
+    return headers, payload
+
+def query_groq_mistral(system_msg, user_msg):
+    headers, payload = _build_request(system_msg, user_msg)
 
     try:
         response = requests.post(API_URL, headers=headers, json=payload)
         print("Groq response status:", response.status_code)
-        print("Groq response body:", response.text)  # ✅ DEBUG OUTPUT
 
         response.raise_for_status()
         return response.json()["choices"][0]["message"]["content"]
@@ -34,3 +41,48 @@ def query_groq_mistral(system_msg, user_msg):
     except requests.exceptions.HTTPError as e:
         print("HTTPError from Groq:", e)
         raise e
+
+async def aquery_groq_mistral(system_msg, user_msg):
+    """
+    Async variant of query_groq_mistral using the shared pooled HTTP client.
+    """
+    headers, payload = _build_request(system_msg, user_msg)
+
+    try:
+        response = await get_client().post(API_URL, headers=headers, json=payload)
+        upstream_requests.inc(service="groq", status=response.status_code)
+
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    except httpx.HTTPStatusError as e:
+        print("HTTPError from Groq:", e, response.text)
+        raise e
+    except httpx.TransportError:
+        upstream_requests.inc(service="groq", status="error")
+        raise
+
+async def astream_groq_mistral(system_msg, user_msg):
+    """
+    Streams the completion (stream: true) and yields content deltas as they arrive.
+    Closing the generator early closes the upstream connection.
+    """
+    headers, payload = _build_request(system_msg, user_msg)
+    payload["stream"] = True
+
+    async with get_client().stream("POST", API_URL, headers=headers, json=payload) as response:
+        upstream_requests.inc(service="groq_stream", status=response.status_code)
+        if response.is_error:
+            await response.aread()
+            print("HTTPError from Groq:", response.status_code, response.text)
+            response.raise_for_status()
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Local CPU backend for nomic-embed-text-v1.5 (EMBED_BACKEND=local in app/embeddings.py).
+#
+# Runs the ONNX export of the model (the onnx/ folder of nomic-ai/nomic-embed-text-v1.5
+# on Hugging Face; model_quantized.onnx is picked when present) with onnxruntime and
+# the `tokenizers` package, both imported only when this backend is used. Output
+# follows Nomic's Matryoshka recipe, so vectors line up with the API's at the same
+# dimensionality: mean pooling -> layer norm -> truncate -> L2 normalize.
+#
+# MicroBatcher folds concurrent requests into one forward pass.
+
+LOCAL_EMBED_MODEL_DIR = os.getenv("LOCAL_EMBED_MODEL_DIR", "models/nomic-embed-text-v1.5")
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", "0"))  # 0 = onnxruntime default (all cores)
+LOCAL_EMBED_MAX_LENGTH = int(os.getenv("LOCAL_EMBED_MAX_LENGTH", "512"))
+LOCAL_EMBED_MAX_BATCH = int(os.getenv("LOCAL_EMBED_MAX_BATCH", "32"))
+LOCAL_EMBED_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBED_MAX_WAIT_MS", "5"))
+
+# nomic-embed models expect the task as a text prefix
+TASK_PREFIXES = {
+    "search_query": "search_query: ",
+    "search_document": "search_document: ",
+    "classification": "classification: ",
+    "clustering": "clustering: ",
+}
+
+MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+
+def find_model_file(model_dir):
+    for name in MODEL_FILES:
+        for path in (os.path.join(model_dir, name), os.path.join(model_dir, "onnx", name)):
+            if os.path.exists(path):
+                return path
+    raise FileNotFoundError(f"No {' or '.join(MODEL_FILES)} under {model_dir}")
+
+def matryoshka(token_embeddings, attention_mask, dimensionality):
+    """
+    Mean-pools (batch, tokens, hidden) over the mask, then layer norm, truncation
+    to `dimensionality` and L2 normalization.
+    """
+    mask = attention_mask[..., None].astype("float32")
+    pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    mean = pooled.mean(axis=1, keepdims=True)
+    var = pooled.var(axis=1, keepdims=True)
+    normed = (pooled - mean) / np.sqrt(var + 1e-5)
+    truncated = normed[:, :dimensionality]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return np.ascontiguousarray(truncated / np.clip(norms, 1e-12, None), dtype="float32")
+
+class LocalEmbedder:
+    """
+    Synchronous ONNX embedder. embed() is thread-safe (onnxruntime sessions are).
+    """
+    def __init__(self, model_dir=LOCAL_EMBED_MODEL_DIR, dimensionality=256, threads=LOCAL_EMBED_THREADS,
+                 max_length=LOCAL_EMBED_MAX_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_path = find_model_file(model_dir)
+        self.dimensionality = dimensionality
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+    def embed(self, texts, task_type="search_query"):
+        """
+        Returns an (n, dimensionality) float32 array for the given texts.
+        """
+        prefix = TASK_PREFIXES.get(task_type, "")
+        encodings = self.tokenizer.encode_batch([prefix + text for text in texts])
+        input_ids = np.array([e.ids for e in encodings], dtype="int64")
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+        return matryoshka(token_embeddings, attention_mask, self.dimensionality)
+
+class LocalBatchEmbedder:
+    """
+    Async callable over a LocalEmbedder with the same interface as
+    data_creation/embed_scheduler.NomicBatchEmbedder, for the offline builds.
+    """
+    def __init__(self, embedder, task_type="search_document"):
+        self.embedder = embedder
+        self.task_type = task_type
+
+    async def __call__(self, texts):
+        return await asyncio.to_thread(self.embedder.embed, texts, self.task_type)
+
+    async def aclose(self):
+        pass
+
+class MicroBatcher:
+    """
+    Collects texts from concurrent callers for up to max_wait_ms (or until
+    max_batch texts are waiting) and embeds them in one forward pass on a single
+    inference thread; each caller gets its own rows back.
+    """
+    def __init__(self, embedder, max_batch=LOCAL_EMBED_MAX_BATCH, max_wait_ms=LOCAL_EMBED_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self._queue = None
+        self._worker = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, texts, task_type="search_query"):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(texts), task_type, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            by_task = {}
+            for item in batch:
+                by_task.setdefault(item[1], []).append(item)
+            for task_type, items in by_task.items():
+                texts = [text for item_texts, _, _ in items for text in item_texts]
+                try:
+                    vectors = await loop.run_in_executor(self._executor, self.embedder.embed, texts, task_type)
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.texts += len(texts)
+                start = 0
+                for item_texts, _, future in items:
+                    if not future.done():
+                        future.set_result(vectors[start:start + len(item_texts)])
+                    start += len(item_texts)
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
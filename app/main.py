@@ -1,31 +1,142 @@
-from fastapi import FastAPI
+import time
+BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 import numpy as np
-from app.vector_search import search_similar_chunks, search_similar_image, get_chunks_by_topic_id
-from app.llm_groq import query_groq_mistral
-from langchain_nomic import NomicEmbeddings
+from app.vector_search import (hybrid_search_batch, search_similar_image, get_chunks_by_topic_ids, get_neighbor_chunks, chunk_key,
+                               loaded_vectorstore_version, reload_if_changed, IMAGE_VECTORSTORE_VERSION)
+from app.llm_groq import aquery_groq_mistral, astream_groq_mistral
+from app.embeddings import embed_query, embed_queries, embedding_cache, local_batcher, DIMENSIONALITY
+from app.answer_cache import AnswerCache
+from app.http_client import close_client
+from app import resources, metrics, ocr, image_cache, context_builder
+from app.clip_encoder import CLIP_MODEL, CLIP_PRETRAINED, CLIP_BACKEND
 from PIL import Image
 import io
+import json
 import base64
-import pytesseract
-import torch
-import open_clip
+import asyncio
+import contextvars
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
-pytesseract.pytesseract.tesseract_cmd = "tesseract"
+# Image requests (OCR + CLIP) can be switched off, in which case the CLIP model,
+# image index and topic chunks are never loaded and the image field is ignored.
+IMAGE_ENABLED = os.getenv("IMAGE_ENABLED", "1") == "1"
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+WARMUP_GROUPS = ["core", "image"] if IMAGE_ENABLED else ["core"]
+# How often (at most) each worker checks for a rebuilt text index; 0 = only on POST /warmup
+VECTORSTORE_CHECK_SECONDS = float(os.getenv("VECTORSTORE_CHECK_SECONDS", "30"))
+
+# Dedicated pool for CPU-bound image work (decode, OCR, CLIP) so that it never
+# queues text-only requests behind it. Remote calls are plain awaits.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+# CLIP backend (torch | int8 | onnx, see app/clip_encoder.py) and its threads per
+# forward pass; by default the cores are split between the image workers instead
+# of every pass trying to use all of them
+CLIP_THREADS = int(os.getenv("CLIP_THREADS", str(max(1, (os.cpu_count() or 1) // IMAGE_WORKERS))))
+
+def _load_clip():
+    # torch/open_clip/onnxruntime are imported here so they don't count against import time
+    from app.clip_encoder import load_clip_encoder
+    return load_clip_encoder(CLIP_BACKEND, threads=CLIP_THREADS)
+
+# Load the CLIP encoder on first use
+clip = resources.lazy("clip_model", _load_clip, group="image", fork_safe=CLIP_BACKEND != "onnx")
+
+def run_in_image_executor(fn, *args):
+    """
+    Runs fn on the image pool in a copy of the current context, so its stage
+    timings land in the calling request's profile.
+    """
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(image_executor, contextvars.copy_context().run, fn, *args)
+
+# Cached image results are keyed on the image bytes plus everything that shapes them
+IMAGE_CACHE_SETTINGS = f"{CLIP_MODEL}/{CLIP_PRETRAINED}/{CLIP_BACKEND}|{ocr.OCR_SETTINGS}"
+
+# Upper bound on chunks pulled in per topic matched by the image search
+MAX_TOPIC_CHUNKS = int(os.getenv("MAX_TOPIC_CHUNKS", "5"))
+
+# Semantic answer cache: paraphrased questions answered from the same chunks reuse the answer
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+answer_cache = AnswerCache(
+    dim=DIMENSIONALITY,
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+)
 
-# Load CLIP model and preprocess
-clip_model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='openai')
-clip_tokenizer = open_clip.get_tokenizer('ViT-B-32')
+# /ask_batch limits
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
 
-# Initialize Nomic Embeddings (API key picked up from env var)
-nomic_embedder = NomicEmbeddings(
-    model="nomic-embed-text-v1.5",
-    dimensionality=256
+SYSTEM_MSG = (
+    "You are a helpful teaching assistant for the TDS course. "
+    "Use the given content to provide a concise, HELPFUL answer.If some information is not available, say you don't know. "
+    "If using discourse data, look for answers by the course TA Jivraj."
 )
 
-app = FastAPI()
+# Request header that asks for a per-stage timing breakdown
+PROFILE_HEADER = "X-Profile"
+
+warmup_state = {"task": None, "seconds": None}
+
+def _warm_up():
+    seconds = resources.warm_up(WARMUP_GROUPS)
+    warmup_state["seconds"] = seconds
+    print(f"Warm-up finished in {seconds:.2f}s\n{resources.timing_report(WARMUP_GROUPS)}")
+    return seconds
+
+def start_warm_up():
+    task = warmup_state["task"]
+    if task is None or task.done():
+        task = asyncio.create_task(asyncio.to_thread(_warm_up))
+        warmup_state["task"] = task
+    return task
+
+_vectorstore_check = {"at": time.monotonic()}
+
+def check_vectorstore():
+    """
+    Called per request: every worker process stats the text store at most once
+    per VECTORSTORE_CHECK_SECONDS and, after a rebuild, drops the loaded index
+    and warms up the new one in the background.
+    """
+    now = time.monotonic()
+    if not VECTORSTORE_CHECK_SECONDS or now - _vectorstore_check["at"] < VECTORSTORE_CHECK_SECONDS:
+        return
+    _vectorstore_check["at"] = now
+    if reload_if_changed():
+        print("Text vector store changed on disk, reloading")
+        start_warm_up()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"App imported in {IMPORT_SECONDS:.2f}s")
+    if WARMUP_ON_STARTUP:
+        start_warm_up()
+    yield
+    await close_client()
+    # Write what the disk tiers still have queued
+    embedding_cache.flush()
+    image_cache.image_cache.flush()
+    if local_batcher is not None and local_batcher.loaded:
+        local_batcher.get().close()
+    image_executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
+
+IMPORT_SECONDS = time.perf_counter() - BOOT_STARTED
+
+# Per-path request metrics and opt-in stage profiles ("X-Profile: 1" -> Server-Timing)
+app.add_middleware(metrics.MetricsMiddleware, profile_header=PROFILE_HEADER)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,78 +150,357 @@ class QueryRequest(BaseModel):
     question: str
     image: str | None = None
 
-@app.post("/ask")
-def ask_question(request: QueryRequest):
-    question = request.question
-    image_b64 = request.image
+class BatchRequest(BaseModel):
+    questions: list[QueryRequest]
 
-    ocr_text = ""
-    image_embedding = None
-    extra_chunks = []
+def load_image(image_b64):
+    """
+    Returns (cache key, cached entry, None) for an image seen before, otherwise
+    (cache key, None, decoded image).
+    """
+    with metrics.stage("decode"):
+        image_data = base64.b64decode(image_b64)
+    with metrics.stage("image_cache"):
+        key = image_cache.image_cache_key(image_data, IMAGE_CACHE_SETTINGS)
+        entry = image_cache.lookup(key)
+    if entry is not None:
+        return key, entry, None
+    with metrics.stage("decode"):
+        return key, None, Image.open(io.BytesIO(image_data)).convert("RGB")
 
-    if image_b64:
-        try:
-            image_data = base64.b64decode(image_b64)
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
+def clip_embed_and_search(image):
+    """
+    Returns the CLIP embedding of the image and the topic ids of its nearest image.
+    """
+    with metrics.stage("clip"):
+        # CLIP image embedding
+        image_embedding = clip.get().encode(image)
 
-            # OCR
-            ocr_text = pytesseract.image_to_string(image)
+        # Search image index
+        return image_embedding, search_similar_image(image_embedding)
 
-            # CLIP image embedding
-            processed = preprocess(image).unsqueeze(0)
-            with torch.no_grad():
-                image_embedding = clip_model.encode_image(processed).detach().cpu().numpy().astype("float32")
+def cached_topic_ids(entry):
+    # Topic ids from an older image index are looked up again with the stored embedding
+    if entry["index_version"] == IMAGE_VECTORSTORE_VERSION:
+        return entry["topic_ids"]
+    with metrics.stage("clip"):
+        return search_similar_image(entry["embedding"])
 
-            # Search image index
-            topic_id = search_similar_image(image_embedding)
-            print("Closest image topic:", topic_id)
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once every enabled component is loaded, 503 before.
+    """
+    is_ready = resources.is_ready(WARMUP_GROUPS)
+    body = {
+        "ready": is_ready,
+        "image_enabled": IMAGE_ENABLED,
+        "import_seconds": IMPORT_SECONDS,
+        "warmup_seconds": warmup_state["seconds"],
+        "components": resources.status(WARMUP_GROUPS)
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
-            if topic_id:
-                extra_chunks = get_chunks_by_topic_id(topic_ids[0])
+@metrics.registry.collector
+def _cache_metrics():
+    caches = {
+        "embedding": embedding_cache.stats(),
+        "answer": answer_cache.stats(),
+        "image": image_cache.image_cache.stats()
+    }
+    return [
+        ("cache_hits_total", "counter", "Cache hits", [({"cache": name}, s["hits"]) for name, s in caches.items()]),
+        ("cache_misses_total", "counter", "Cache misses", [({"cache": name}, s["misses"]) for name, s in caches.items()]),
+        ("cache_hit_ratio", "gauge", "Cache hits / lookups", [({"cache": name}, s["hit_rate"]) for name, s in caches.items()]),
+        ("cache_entries", "gauge", "Entries held in memory", [({"cache": name}, s["size"]) for name, s in caches.items()]),
+        ("resource_loaded", "gauge", "1 once a lazy resource is loaded",
+         [({"resource": name}, int(s["loaded"])) for name, s in resources.status().items()]),
+    ]
 
-        except Exception as e:
-            print(f"Image processing failed: {e}")
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/warmup")
+async def warmup():
+    # A rebuilt text index is picked up here at once (other workers notice it
+    # within VECTORSTORE_CHECK_SECONDS); answers cached from the old one are
+    # dropped on the next lookup (see AnswerCache.check_version)
+    if reload_if_changed():
+        print("Text vector store changed on disk, reloading")
+    await start_warm_up()
+    return await ready()
+
+async def start_image_stage(image_b64):
+    """
+    Decodes the image and starts OCR and CLIP in parallel. Returns the OCR
+    result (see ocr.extract_text; only OCR gates the text embedding, None
+    without an image) and the still-running CLIP future.
+    """
+    if not image_b64:
+        return None, None
+    if not IMAGE_ENABLED:
+        print("Image ignored: IMAGE_ENABLED=0")
+        return None, None
+
+    try:
+        key, entry, image = await run_in_image_executor(load_image, image_b64)
+    except Exception as e:
+        print(f"Image processing failed: {e}")
+        return None, None
+
+    if entry is not None:
+        ocr_result = dict(entry["ocr"], ms=0.0, cached=True)
+        return ocr_result, asyncio.ensure_future(run_in_image_executor(cached_topic_ids, entry))
+
+    ocr_future = run_in_image_executor(ocr.extract_text, image)
+    clip_future = run_in_image_executor(clip_embed_and_search, image)
+    ocr_result = await ocr_future
+    return ocr_result, asyncio.ensure_future(clip_and_store(key, ocr_result, clip_future))
+
+async def clip_and_store(key, ocr_result, clip_future):
+    """
+    Waits for CLIP, caches the image's results and returns its topic ids.
+    """
+    embedding, topic_ids = await clip_future
+    image_cache.store(key, ocr_result, embedding, topic_ids, IMAGE_VECTORSTORE_VERSION)
+    return topic_ids
+
+def image_diagnostics(ocr_result):
+    return {"ocr": ocr.diagnostics(ocr_result)} if ocr_result else {}
+
+async def finish_image_stage(clip_future):
+    """
+    Waits for the CLIP search and returns the chunks of the matched topics.
+    """
+    if clip_future is None:
+        return []
+    try:
+        topic_ids = await clip_future
+        print("Closest image topic:", topic_ids)
+
+        if topic_ids:
+            with metrics.stage("context"):
+                return get_chunks_by_topic_ids(topic_ids, max_per_topic=MAX_TOPIC_CHUNKS)
+
+    except Exception as e:
+        print(f"Image processing failed: {e}")
+    return []
 
+def combine_text(question, ocr_result):
     # Combine text from question and OCR
     combined_text = question
-    if ocr_text.strip():
-        combined_text += "\n\nExtracted from image:\n" + ocr_text.strip()
+    ocr_text = ocr_result["text"].strip() if ocr_result else ""
+    if ocr_text:
+        combined_text += "\n\nExtracted from image:\n" + ocr_text
+    return combined_text
+
+def merge_chunks(semantic_chunks, extra_chunks):
+    # Search hits (and their neighbours) first, then image-matched chunks, deduplicated
+    # and cut to the context token budget (see app/context_builder.py)
+    return context_builder.select_chunks(semantic_chunks, extra_chunks, neighbor_fn=get_neighbor_chunks)
+
+def build_user_msg(question, chunks):
+    # Adjacent chunks of a document are merged into one passage without their overlap
+    context = context_builder.format_context(context_builder.merge_passages(chunks))
+    metrics.context_tokens.observe(context_builder.estimate_tokens(context))
+    return f"Context:\n{context}\n\nQuery: {question}"
+
+def make_links(chunks):
+    # One link per retrieved chunk; neighbours pulled in around a hit only add context
+    return [{"url": c.get("url"), "text": c.get("title", c.get("source"))} for c in chunks if not c.get("neighbor")]
+
+async def generate_answer(question, embedding, chunks):
+    """
+    Answers from the semantic cache when possible, otherwise calls Groq.
+    """
+    context_key = tuple(chunk_key(c) for c in chunks)
+    version = loaded_vectorstore_version()
+    answer = None
+    if ANSWER_CACHE_ENABLED:
+        with metrics.stage("answer_cache"):
+            answer = answer_cache.lookup(embedding, context_key, version)
+
+    if answer is None:
+        with metrics.stage("context"):
+            user_msg = build_user_msg(question, chunks)
+        with metrics.stage("llm"):
+            answer = await aquery_groq_mistral(SYSTEM_MSG, user_msg)
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.store(embedding, context_key, answer, version)
+    return answer
+
+async def retrieve(question, image_b64):
+    """
+    Runs the image stage, embeds the combined text and searches. Returns the
+    query embedding, the merged chunks and the image diagnostics.
+    """
+    check_vectorstore()
+    ocr_result, clip_future = await start_image_stage(image_b64)
+    combined_text = combine_text(question, ocr_result)
 
     # Embed and search using text
     try:
-        embedding = nomic_embedder.embed_query(combined_text)
+        with metrics.stage("embed"):
+            embedding = await embed_query(combined_text)
     except Exception as e:
         print(f"Nomic Embedding Error: {e}")
         raise
 
     embedding = np.array(embedding, dtype="float32").reshape(1, -1)
 
-    semantic_chunks = search_similar_chunks(embedding, k=3)
-
-    # Combine both sets of chunks, avoid duplicates
-    all_chunks = semantic_chunks
-    seen_ids = {c.get("id") for c in semantic_chunks}
-    for c in extra_chunks:
-        if c.get("id") not in seen_ids:
-            all_chunks.append(c)
+    with metrics.stage("search"):
+        semantic_chunks = hybrid_search_batch([combined_text], embedding, k=3)[0]
+    extra_chunks = await finish_image_stage(clip_future)
+    with metrics.stage("context"):
+        all_chunks = merge_chunks(semantic_chunks, extra_chunks)
+    return embedding, all_chunks, image_diagnostics(ocr_result)
 
-    # Build context
-    context = "\n\n".join(
-        f"Title: {c.get('title', c.get('source', 'Unknown'))}\nChunk: {c['text']}"
-        for c in all_chunks
-    )
-
-    system_msg = (
-        "You are a helpful teaching assistant for the TDS course. "
-        "Use the given content to provide a concise, HELPFUL answer.If some information is not available, say you don't know. "
-        "If using discourse data, look for answers by the course TA Jivraj."
-    )
-    user_msg = f"Context:\n{context}\n\nQuery: {question}"
+@app.post("/ask")
+async def ask_question(request: QueryRequest):
+    question = request.question
+    embedding, all_chunks, diagnostics = await retrieve(question, request.image)
 
-    answer = query_groq_mistral(system_msg, user_msg)
-    links = [{"url": c.get("url"), "text": c.get("title", c.get("source"))} for c in all_chunks]
+    answer = await generate_answer(question, embedding, all_chunks)
+    links = make_links(all_chunks)
     print(links)
-    return {
+    response = {
         "answer": answer,
         "links": links
     }
+    if diagnostics:
+        response["diagnostics"] = diagnostics
+    return response
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(request: QueryRequest, http_request: Request):
+    """
+    Server-sent events: a "links" event once retrieval is done, then one
+    "token" event per answer delta, then "done" with the full answer (or
+    "error"). The upstream Groq stream is closed if the client goes away.
+    """
+    question = request.question
+    # Headers go out before retrieval, so a requested profile rides on the "done" event
+    wants_profile = bool(http_request.headers.get(PROFILE_HEADER))
+
+    diagnostics = {}
+
+    def done_data(answer):
+        data = {"answer": answer}
+        if diagnostics:
+            data["diagnostics"] = diagnostics
+        profile = metrics.current_profile()
+        if wants_profile and profile is not None:
+            data["profile_ms"] = {name: round(seconds * 1000, 1) for name, seconds in profile.items()}
+        return data
+
+    async def events():
+        # Flush headers right away; retrieval happens inside the stream
+        yield ": retrieving\n\n"
+        try:
+            embedding, all_chunks, image_diag = await retrieve(question, request.image)
+        except Exception as e:
+            yield sse_event("error", f"Retrieval failed: {e}")
+            return
+        diagnostics.update(image_diag)
+        yield sse_event("links", make_links(all_chunks))
+
+        context_key = tuple(chunk_key(c) for c in all_chunks)
+        version = loaded_vectorstore_version()
+        answer = None
+        if ANSWER_CACHE_ENABLED:
+            with metrics.stage("answer_cache"):
+                answer = answer_cache.lookup(embedding, context_key, version)
+        if answer is not None:
+            yield sse_event("token", answer)
+            yield sse_event("done", done_data(answer))
+            return
+
+        with metrics.stage("context"):
+            user_msg = build_user_msg(question, all_chunks)
+        parts = []
+        tokens = astream_groq_mistral(SYSTEM_MSG, user_msg)
+        llm_started = time.perf_counter()
+        try:
+            async for token in tokens:
+                if await http_request.is_disconnected():
+                    print("Client disconnected, cancelling Groq stream")
+                    return
+                if not parts:
+                    metrics.record_stage("llm_first_token", time.perf_counter() - llm_started)
+                parts.append(token)
+                yield sse_event("token", token)
+        except Exception as e:
+            print(f"Groq stream failed: {e}")
+            metrics.stage_errors.inc(stage="llm")
+            yield sse_event("error", str(e))
+            return
+        finally:
+            await tokens.aclose()
+        metrics.record_stage("llm", time.perf_counter() - llm_started)
+
+        answer = "".join(parts)
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.store(embedding, context_key, answer, version)
+        yield sse_event("done", done_data(answer))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask_batch")
+async def ask_batch(request: BatchRequest):
+    """
+    Answers many questions at once: one embedding call, one multi-row FAISS
+    search, then the LLM calls with bounded concurrency. Results come back in
+    request order; a failed item carries an "error" instead of an answer.
+    """
+    items = request.questions
+    if len(items) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    if not items:
+        return {"results": []}
+
+    check_vectorstore()
+    image_stages = await asyncio.gather(*(start_image_stage(item.image) for item in items))
+    combined_texts = [combine_text(item.question, ocr_result) for item, (ocr_result, _) in zip(items, image_stages)]
+
+    try:
+        with metrics.stage("embed"):
+            embeddings = np.array(await embed_queries(combined_texts), dtype="float32")
+    except Exception as e:
+        print(f"Nomic Embedding Error: {e}")
+        for _, clip_future in image_stages:
+            if clip_future is not None:
+                clip_future.cancel()
+        return {"results": [{"index": i, "error": f"Embedding failed: {e}"} for i in range(len(items))]}
+
+    with metrics.stage("search"):
+        semantic_results = hybrid_search_batch(combined_texts, embeddings, k=3)
+    extra_results = await asyncio.gather(*(finish_image_stage(clip_future) for _, clip_future in image_stages))
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer_item(i):
+        with metrics.stage("context"):
+            all_chunks = merge_chunks(semantic_results[i], extra_results[i])
+        try:
+            async with semaphore:
+                answer = await generate_answer(items[i].question, embeddings[i:i + 1], all_chunks)
+        except Exception as e:
+            print(f"Batch item {i} failed: {e}")
+            result = {"index": i, "error": str(e), "links": make_links(all_chunks)}
+        else:
+            result = {"index": i, "answer": answer, "links": make_links(all_chunks)}
+        diagnostics = image_diagnostics(image_stages[i][0])
+        if diagnostics:
+            result["diagnostics"] = diagnostics
+        return result
+
+    results = await asyncio.gather(*(answer_item(i) for i in range(len(items))))
+    return {"results": results}
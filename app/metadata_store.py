@@ -0,0 +1,162 @@
+import hashlib
+import json
+import mmap
+import os
+import sys
+import numpy as np
+
+# Offset-indexed, memory-mapped metadata file (replaces json.load of tds_metadata.json).
+#
+# Layout (little endian):
+#   8 bytes   magic b"TDSMETA1"
+#   uint64    row count N
+#   uint64    N + 1 offsets into the payload (row i = payload[off[i]:off[i+1]])
+#   payload   compact UTF-8 JSON of each row, back to back
+#
+# Only the rows a search returns are ever decoded; the rest stays in the page cache.
+#
+# When the FAISS index is ID-mapped, <name>.ids.npy holds the stable id of each
+# row so search labels can be turned back into rows.
+#
+# <name>.chunks.npy holds (hash of url + chunk_id, row) pairs sorted by hash, so
+# the chunks around a search hit are found with a binary search of a mmap'd
+# array instead of a dict built from every row at startup.
+MAGIC = b"TDSMETA1"
+HEADER_SIZE = len(MAGIC) + 8
+
+def ids_path(path):
+    return os.path.splitext(path)[0] + ".ids.npy"
+
+def chunk_keys_path(path):
+    return os.path.splitext(path)[0] + ".chunks.npy"
+
+def chunk_hash(url, chunk_id):
+    digest = hashlib.blake2b(f"{url}|{chunk_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+def write_metadata_store(path, rows, ids=None):
+    """
+    Writes rows (dicts) to path atomically, in the order given (= FAISS row
+    order), plus the chunk keys file and, when the index uses stable ids, the
+    row ids file.
+    """
+    offsets = [0]
+    payload = []
+    chunk_keys = []
+    for row_num, row in enumerate(rows):
+        blob = json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        payload.append(blob)
+        offsets.append(offsets[-1] + len(blob))
+        if row.get("chunk_id", -1) >= 0:
+            chunk_keys.append((chunk_hash(row.get("url", ""), row["chunk_id"]), row_num))
+
+    # Everything goes to temp files first; the sidecars are swapped in before the
+    # .bin, so a reader that sees the new .bin (and its new fingerprint) also
+    # finds the sidecars that belong to it
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(payload)).tobytes())
+        f.write(np.asarray(offsets, dtype="<u8").tobytes())
+        for blob in payload:
+            f.write(blob)
+
+    # Stable sort: of duplicate chunks, the first row is found first
+    chunk_keys = np.asarray(chunk_keys, dtype="int64").reshape(-1, 2)
+    sidecars = [(chunk_keys_path(path), chunk_keys[np.argsort(chunk_keys[:, 0], kind="stable")])]
+    if ids is not None:
+        sidecars.append((ids_path(path), np.asarray(ids, dtype="int64")))
+    for sidecar, array in sidecars:
+        with open(sidecar + ".tmp", "wb") as f:
+            np.save(f, array)
+
+    for sidecar, _ in sidecars:
+        os.replace(sidecar + ".tmp", sidecar)
+    if ids is None and os.path.exists(ids_path(path)):
+        os.remove(ids_path(path))
+    os.replace(tmp_path, path)
+    return len(payload)
+
+class MetadataStore:
+    """
+    Read-only, list-like view over a file written by write_metadata_store.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a metadata store")
+        self._count = int(np.frombuffer(self._mm, dtype="<u8", count=1, offset=len(MAGIC))[0])
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=self._count + 1, offset=HEADER_SIZE)
+        self._payload_start = HEADER_SIZE + 8 * (self._count + 1)
+
+        self.ids = None
+        if os.path.exists(ids_path(path)):
+            self.ids = np.load(ids_path(path), mmap_mode="r")
+            if len(self.ids) != self._count:
+                raise ValueError(f"{ids_path(path)} has {len(self.ids)} ids for {self._count} rows")
+            self._id_order = np.argsort(self.ids)
+            self._sorted_ids = self.ids[self._id_order]
+
+        self.chunk_keys = None
+        if os.path.exists(chunk_keys_path(path)):
+            self.chunk_keys = np.load(chunk_keys_path(path), mmap_mode="r")
+            if len(self.chunk_keys) and int(self.chunk_keys[:, 1].max()) >= self._count:
+                self.chunk_keys = None  # from another build; vector_search falls back to a dict
+
+    def rows_for_labels(self, labels):
+        """
+        Maps FAISS search labels to row numbers (-1 for unknown or missing labels).
+        """
+        labels = np.asarray(labels, dtype="int64")
+        if self.ids is None:
+            return labels
+        pos = np.searchsorted(self._sorted_ids, labels)
+        pos = np.clip(pos, 0, len(self._sorted_ids) - 1)
+        found = (self._sorted_ids[pos] == labels) & (labels >= 0)
+        return np.where(found, self._id_order[pos], -1)
+
+    def find_chunk(self, url, chunk_id):
+        """
+        The row for (url, chunk_id), or None. Needs the chunk keys file.
+        """
+        key = chunk_hash(url, chunk_id)
+        hashes = self.chunk_keys[:, 0]
+        pos = int(np.searchsorted(hashes, key))
+        while pos < len(hashes) and hashes[pos] == key:
+            row = self[self.chunk_keys[pos, 1]]
+            if row.get("url", "") == url and row.get("chunk_id", -1) == chunk_id:
+                return row
+            pos += 1
+        return None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError(idx)
+        start = self._payload_start + int(self._offsets[idx])
+        end = self._payload_start + int(self._offsets[idx + 1])
+        return json.loads(self._mm[start:end])
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self[idx]
+
+    def close(self):
+        self._offsets = None
+        self._mm.close()
+        self._file.close()
+
+if __name__ == "__main__":
+    # Convert an existing JSON metadata file: python app/metadata_store.py in.json [out.bin]
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0] + ".bin"
+    with open(src, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    print(f"Wrote {write_metadata_store(dst, rows)} rows to {dst}")
@@ -0,0 +1,231 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from starlette.datastructures import Headers, MutableHeaders
+
+# In-process metrics with Prometheus text exposition (served on /metrics), plus
+# per-request stage profiles.
+#
+# stage("embed") times a block into the stage_seconds histogram and, if the
+# current request asked for it, into that request's profile. The profile lives in
+# a contextvar, so it follows the request through awaits and into executor
+# threads started with copy_context().run (see main.run_in_image_executor).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        samples = []
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), values[-1]))
+            samples.append((f"{self.name}_sum", key, values[-2]))
+            samples.append((f"{self.name}_count", key, values[-1]))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self._add(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def collector(self, fn):
+        """
+        Registers fn() -> [(name, kind, help, [(labels dict, value), ...])], called
+        on every scrape (for values owned elsewhere, e.g. cache counters).
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for fn in self._collectors:
+            for name, kind, help, values in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by path and status code")
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served, by path")
+http_seconds = registry.histogram("http_request_duration_seconds", "Request latency by path (streams: until the last byte)")
+stage_seconds = registry.histogram("stage_duration_seconds", "Time spent per pipeline stage")
+stage_errors = registry.counter("stage_errors_total", "Pipeline stages that raised, by stage")
+upstream_requests = registry.counter("upstream_requests_total", "Calls to remote APIs by service and status code")
+ocr_results = registry.counter("ocr_results_total", "OCR attempts by outcome (ok, no_text, timeout, busy, error, disabled)")
+context_tokens = registry.histogram("context_tokens", "Estimated tokens of prompt context per LLM call",
+                                    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000))
+
+# --- per-request profiles ---
+_profile = contextvars.ContextVar("profile", default=None)
+
+def start_profile():
+    """
+    Starts collecting stage timings for the current request; returns the dict they go into.
+    """
+    profile = {}
+    _profile.set(profile)
+    return profile
+
+def current_profile():
+    return _profile.get()
+
+def record_stage(name, seconds):
+    stage_seconds.observe(seconds, stage=name)
+    profile = _profile.get()
+    if profile is not None:
+        profile[name] = profile.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def server_timing(profile):
+    """
+    Server-Timing header value (milliseconds), e.g. 'embed;dur=41.2, llm;dur=812.0'.
+    """
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in profile.items())
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request counts, latency and in-flight gauges per route path,
+    and a fresh stage profile per request. Requests carrying the profile header
+    (e.g. "X-Profile: 1") get it back as a Server-Timing response header.
+    """
+    def __init__(self, app, profile_header="x-profile"):
+        self.app = app
+        self.profile_header = profile_header
+        self._paths = None
+
+    def _label(self, scope):
+        # Paths that aren't routes share one label, so scanners can't blow up the series count
+        if self._paths is None:
+            self._paths = {getattr(route, "path", None) for route in scope["app"].routes}
+        return scope["path"] if scope["path"] in self._paths else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = self._label(scope)
+        profile = start_profile()
+        wants_profile = bool(Headers(scope=scope).get(self.profile_header))
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if wants_profile and profile:
+                    MutableHeaders(scope=message).append("Server-Timing", server_timing(profile))
+            await send(message)
+
+        started = time.perf_counter()
+        http_in_flight.inc(path=path)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            http_in_flight.dec(path=path)
+            http_requests.inc(path=path, status=status["code"])
+            http_seconds.observe(time.perf_counter() - started, path=path)
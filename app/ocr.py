@@ -0,0 +1,178 @@
+import io
+import os
+import shlex
+import subprocess
+import threading
+import time
+import numpy as np
+from PIL import Image
+from app import metrics
+
+# OCR for uploaded images, cheapest exit first:
+#   1. a text-presence check on a small grayscale copy (a few ms) skips tesseract
+#      for photos and diagrams without text;
+#   2. large screenshots are downscaled and binarized before OCR;
+#   3. tesseract runs in its own process, one per call; at most OCR_WORKERS run
+#      at once and each is killed after OCR_TIMEOUT seconds.
+# extract_text() blocks, so main.py calls it on the image thread pool.
+
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+
+# Tesseract spreads one page over all cores with OpenMP, which only contends
+# with the other workers and requests; one thread per process is faster overall.
+# Only the tesseract process gets the limit: torch's libgomp reads the same
+# variable, and the CLIP backends size their own thread pools (CLIP_THREADS).
+TESSERACT_OMP_THREADS = os.getenv("TESSERACT_OMP_THREADS", "1")
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))  # concurrent tesseract processes
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "5"))  # seconds, including the wait for a free worker
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))  # longer screenshots are downscaled to this
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "1") == "1"
+OCR_CONFIG = os.getenv("OCR_CONFIG", "--oem 1 --psm 3")
+
+# Text-presence check: rows of the downscaled image with at least DETECT_MIN_STROKES
+# thin dark-on-light (or light-on-dark) strokes, counted only where they form
+# bands of line height (DETECT_MIN_LINE to DETECT_MAX_LINE rows) with quieter rows
+# around them, as lines of text do; fewer than OCR_MIN_TEXT_ROWS such rows means
+# there is nothing for tesseract to read. OCR_DETECT=0 always runs OCR.
+OCR_DETECT = os.getenv("OCR_DETECT", "1") == "1"
+OCR_DETECT_SIDE = int(os.getenv("OCR_DETECT_SIDE", "1024"))
+OCR_MIN_TEXT_ROWS = int(os.getenv("OCR_MIN_TEXT_ROWS", "4"))
+DETECT_CONTRAST = 40  # grey levels between a stroke and its background
+DETECT_MAX_STROKE = 6  # pixels, at detection size
+DETECT_MIN_STROKES = 3
+DETECT_MIN_LINE = 3  # rows, at detection size; thinner bands are stray edges
+DETECT_MAX_LINE = 64  # taller bands are texture (noise, foliage, fabric), not a line of text
+
+# Everything that changes the text OCR returns, for keying cached results
+OCR_SETTINGS = f"{OCR_ENABLED}|{OCR_DETECT}|{OCR_DETECT_SIDE}|{OCR_MIN_TEXT_ROWS}|{OCR_MAX_SIDE}|{OCR_BINARIZE}|{OCR_CONFIG}"
+
+_slots = threading.BoundedSemaphore(max(1, OCR_WORKERS))
+
+def _grayscale(image, max_side):
+    gray = image.convert("L")
+    if max(gray.size) > max_side:
+        gray.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return gray
+
+def text_rows(image):
+    """
+    Counts rows of the image that look like they cross a line of text: several
+    strokes, i.e. a strong edge followed within a few pixels by the opposite edge,
+    in a band of such rows no taller than a line. Photo and gradient edges are
+    mostly single steps and don't count; noise and fine texture have strokes in
+    every row, so their bands run far past line height and don't count either.
+    """
+    pixels = np.asarray(_grayscale(image, OCR_DETECT_SIDE), dtype="int16")
+    if pixels.shape[1] < 2:
+        return 0
+    dx = np.diff(pixels, axis=1)
+    falling = dx < -DETECT_CONTRAST
+    rising = dx > DETECT_CONTRAST
+    strokes = np.zeros_like(falling)
+    for width in range(1, DETECT_MAX_STROKE + 1):
+        strokes[:, :-width] |= falling[:, :-width] & rising[:, width:]
+        strokes[:, :-width] |= rising[:, :-width] & falling[:, width:]
+    stroke_rows = np.concatenate(([0], (strokes.sum(axis=1) >= DETECT_MIN_STROKES).astype("int8"), [0]))
+    edges = np.diff(stroke_rows)
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return int(heights[(heights >= DETECT_MIN_LINE) & (heights <= DETECT_MAX_LINE)].sum())
+
+def has_text(image):
+    return text_rows(image) >= OCR_MIN_TEXT_ROWS
+
+def otsu_threshold(pixels):
+    """
+    Grey level that best separates the histogram into two classes (Otsu's method).
+    """
+    hist = np.bincount(pixels.ravel(), minlength=256).astype("float64")
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+def prepare_for_ocr(image):
+    """
+    Grayscale, downscaled to OCR_MAX_SIDE and (with OCR_BINARIZE) thresholded to
+    black and white, which is what tesseract would do internally anyway, only on
+    a smaller image that is cheaper to hand over.
+    """
+    gray = _grayscale(image, OCR_MAX_SIDE)
+    if not OCR_BINARIZE:
+        return gray
+    pixels = np.asarray(gray)
+    binary = np.where(pixels > otsu_threshold(pixels), 255, 0).astype("uint8")
+    return Image.fromarray(binary, mode="L")
+
+def run_tesseract(image, timeout):
+    """
+    Runs tesseract once a worker slot frees up. Returns (text, status).
+    """
+    started = time.perf_counter()
+    if not _slots.acquire(timeout=timeout):
+        return "", "busy"
+    try:
+        remaining = timeout - (time.perf_counter() - started)
+        if remaining <= 0:
+            return "", "timeout"
+        png = io.BytesIO()
+        image.save(png, format="PNG")
+        try:
+            done = subprocess.run(
+                [TESSERACT_CMD, "stdin", "stdout", *shlex.split(OCR_CONFIG)],
+                input=png.getvalue(), capture_output=True, timeout=remaining,
+                env=dict(os.environ, OMP_THREAD_LIMIT=TESSERACT_OMP_THREADS)
+            )
+        except subprocess.TimeoutExpired:
+            # subprocess.run kills tesseract before raising this
+            return "", "timeout"
+        if done.returncode != 0:
+            raise RuntimeError(f"tesseract exited with {done.returncode}: {done.stderr.decode(errors='replace').strip()}")
+        return done.stdout.decode("utf-8", errors="replace"), "ok"
+    finally:
+        _slots.release()
+
+def extract_text(image, timeout=OCR_TIMEOUT):
+    """
+    OCR with the fast paths above. Returns {"text", "status", "ms", "size"},
+    where status is ok, no_text, disabled, busy, timeout or error and size is
+    the (width, height) tesseract was given.
+    """
+    started = time.perf_counter()
+    text, status, size = "", "ok", None
+    try:
+        if not OCR_ENABLED:
+            status = "disabled"
+        else:
+            with metrics.stage("ocr_detect"):
+                found = not OCR_DETECT or has_text(image)
+            if not found:
+                status = "no_text"
+            else:
+                with metrics.stage("ocr_prepare"):
+                    prepared = prepare_for_ocr(image)
+                size = prepared.size
+                with metrics.stage("ocr"):
+                    text, status = run_tesseract(prepared, timeout)
+    except Exception as e:
+        print(f"OCR failed: {e}")
+        status = "error"
+    metrics.ocr_results.inc(status=status)
+    return {"text": text, "status": status, "ms": (time.perf_counter() - started) * 1000, "size": size}
+
+def diagnostics(result):
+    """
+    The part of an extract_text() result that goes back to the client.
+    """
+    return {
+        "status": result["status"],
+        "ms": round(result["ms"], 1),
+        "chars": len(result["text"].strip()),
+        "size": list(result["size"]) if result["size"] else None,
+        "cached": result.get("cached", False)
+    }
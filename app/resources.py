@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Deferred loading of the heavy pieces (models, indexes, metadata). Each one is
+# built on first use or by the background warm-up, and its load time is recorded
+# so /ready can show where boot time goes.
+PROCESS_STARTED = time.perf_counter()
+
+_registry = OrderedDict()
+
+class LazyResource:
+    def __init__(self, name, loader, group="core", fork_safe=True):
+        self.name = name
+        self.group = group
+        # False for values that own native thread pools (onnxruntime sessions),
+        # which don't survive os.fork; app/serve.py leaves those to the workers
+        self.fork_safe = fork_safe
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.error = None
+        self.started_at = None
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                self.started_at = time.perf_counter() - PROCESS_STARTED
+                t0 = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = time.perf_counter() - t0
+                self.error = None
+                self._loaded = True
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._loaded = False
+            self.load_seconds = None
+
+    def status(self):
+        return {
+            "group": self.group,
+            "loaded": self._loaded,
+            "started_at": self.started_at,
+            "load_seconds": self.load_seconds,
+            "error": self.error
+        }
+
+def lazy(name, loader, group="core", fork_safe=True):
+    resource = LazyResource(name, loader, group, fork_safe)
+    _registry[name] = resource
+    return resource
+
+def resources(groups=None):
+    return [r for r in _registry.values() if groups is None or r.group in groups]
+
+def warm_up(groups=None):
+    """
+    Loads every registered resource in the given groups. Failures are recorded
+    on the resource and do not stop the remaining loads.
+    """
+    t0 = time.perf_counter()
+    for resource in resources(groups):
+        try:
+            resource.get()
+        except Exception as e:
+            print(f"Warm-up failed for {resource.name}: {e}")
+    return time.perf_counter() - t0
+
+def status(groups=None):
+    return {r.name: r.status() for r in resources(groups)}
+
+def is_ready(groups=None):
+    return all(r.loaded for r in resources(groups))
+
+def timing_report(groups=None):
+    loads = sorted(
+        ((r.name, r.load_seconds) for r in resources(groups) if r.load_seconds is not None),
+        key=lambda item: -item[1]
+    )
+    lines = [f"{name:<20} {seconds * 1000:9.1f} ms" for name, seconds in loads]
+    total = sum(seconds for _, seconds in loads)
+    lines.append(f"{'total':<20} {total * 1000:9.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,215 @@
+"""
+Preload-then-fork server: loads the models, indexes and metadata once, then
+forks workers that share them copy-on-write.
+
+    python -m app.serve --workers 4 --port 8000
+    python -m app.serve --report <master pid>     # per-process memory of a running server
+    kill -USR1 <master pid>                       # same report, printed by the server
+
+With `uvicorn --workers N` every worker loads its own copy of everything, so
+memory grows with N. Here the master warms up the fork-safe resources (see
+LazyResource.fork_safe), freezes the GC so collections in the workers don't
+write to the inherited objects, binds the socket and forks; workers accept on
+the shared socket. Resources that own native thread pools (onnxruntime
+sessions) are loaded by each worker's own warm-up instead. Metadata and chunk
+shards are mmap'd and shared through the page cache either way.
+
+The memory report reads /proc/<pid>/smaps_rollup (Linux). USS is memory only
+that process holds (what each extra worker costs); PSS splits shared pages
+between the processes using them, so the PSS column adds up to the real total.
+Metrics on /metrics are per worker.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+def read_memory(pid):
+    """
+    Memory of one process in kB from /proc/<pid>/smaps_rollup, plus "Uss"
+    (private clean + dirty); None if the process is gone or unreadable.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in SMAPS_FIELDS:
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        return None
+    values["Uss"] = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return values
+
+def child_pids(pid):
+    pids = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+def memory_report(master_pid, worker_pids=None):
+    """
+    Table of RSS / PSS / USS / shared memory (MB) for the master and its workers.
+    """
+    if worker_pids is None:
+        worker_pids = child_pids(master_pid)
+    rows = [("master", master_pid)] + [(f"worker {i}", pid) for i, pid in enumerate(sorted(worker_pids))]
+    lines = [f"{'process':<10} {'pid':>7} {'rss MB':>9} {'pss MB':>9} {'uss MB':>9} {'shared MB':>10}"]
+    totals = {"Rss": 0, "Pss": 0, "Uss": 0}
+    worker_uss = []
+    for label, pid in rows:
+        mem = read_memory(pid)
+        if mem is None:
+            lines.append(f"{label:<10} {pid:>7} {'(unavailable)':>9}")
+            continue
+        shared = mem.get("Shared_Clean", 0) + mem.get("Shared_Dirty", 0)
+        lines.append(f"{label:<10} {pid:>7} {mem['Rss'] / 1024:>9.1f} {mem['Pss'] / 1024:>9.1f} "
+                     f"{mem['Uss'] / 1024:>9.1f} {shared / 1024:>10.1f}")
+        for name in totals:
+            totals[name] += mem[name]
+        if pid != master_pid:
+            worker_uss.append(mem["Uss"])
+    lines.append(f"{'total':<10} {'':>7} {totals['Rss'] / 1024:>9.1f} {totals['Pss'] / 1024:>9.1f} "
+                 f"{totals['Uss'] / 1024:>9.1f}")
+    if worker_uss:
+        lines.append(f"Each extra worker costs about {sum(worker_uss) / len(worker_uss) / 1024:.1f} MB (mean worker USS); "
+                     f"all processes together use {totals['Pss'] / 1024:.1f} MB (sum of PSS)")
+    return "\n".join(lines)
+
+def preload(main):
+    """
+    Loads every fork-safe resource of the enabled groups in the master.
+    """
+    from app import resources
+    if main.CLIP_BACKEND in ("torch", "int8"):
+        # OpenMP thread pools don't survive fork: load on one thread and let each
+        # worker size its own pool on first use (TorchClipEncoder.encode)
+        try:
+            import torch
+            torch.set_num_threads(1)
+        except ImportError:
+            pass
+    t0 = time.perf_counter()
+    for resource in resources.resources(main.WARMUP_GROUPS):
+        if not resource.fork_safe:
+            continue
+        try:
+            resource.get()
+        except Exception as e:
+            print(f"Preload failed for {resource.name}: {e}")
+    seconds = time.perf_counter() - t0
+    main.warmup_state["seconds"] = seconds
+    print(f"Preloaded in {seconds:.2f}s\n{resources.timing_report(main.WARMUP_GROUPS)}")
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(main, sock, args):
+    import uvicorn
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(main.app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def spawn_worker(main, sock, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(main, sock, args)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def serve(args):
+    from app import main
+    preload(main)
+
+    # Everything allocated so far moves to the permanent generation: collections
+    # in the workers no longer touch (and so copy) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    workers = {spawn_worker(main, sock, args) for _ in range(args.workers)}
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"(master pid {os.getpid()}; kill -USR1 for a memory report)")
+
+    state = {"stopping": False, "report": False}
+
+    def stop(signum, frame):
+        state["stopping"] = True
+
+    def request_report(signum, frame):
+        state["report"] = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, request_report)
+
+    report_at = time.monotonic() + args.report_after if args.report_after >= 0 else None
+    while not state["stopping"]:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid in workers:
+            # A crashed worker is replaced by a fresh fork of the warmed-up master
+            workers.discard(pid)
+            print(f"Worker {pid} exited with status {status}, starting a new one")
+            workers.add(spawn_worker(main, sock, args))
+            continue
+        if state["report"] or (report_at is not None and time.monotonic() >= report_at):
+            state["report"], report_at = False, None
+            print(memory_report(os.getpid(), workers))
+        time.sleep(0.2)
+
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5, help="seconds to keep idle HTTP connections open")
+    parser.add_argument("--report-after", type=float, default=30,
+                        help="print the memory report this many seconds after start (-1: only on SIGUSR1)")
+    parser.add_argument("--report", type=int, metavar="PID", help="print the memory report of a running server and exit")
+    args = parser.parse_args()
+
+    if args.report:
+        print(memory_report(args.report))
+        sys.exit(0)
+    if not hasattr(os, "fork"):
+        sys.exit("app.serve needs os.fork (Linux/macOS); use uvicorn on this platform")
+    serve(args)
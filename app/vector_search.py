@@ -3,57 +3,284 @@ import os
 import numpy as np
 import faiss
 import json
+from app.resources import lazy
+from app.metadata_store import MetadataStore, ids_path, chunk_keys_path
+from app.ann_index import load_params, apply_search_params
+from app.bm25 import BM25Index, reciprocal_rank_fusion
+from app.chunk_io import ChunkReader, resolve_chunks_path
 
-# Load index and metadata
-index = faiss.read_index("app/vectorstore/tds_index.faiss")
-with open("app/vectorstore/tds_metadata.json", "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+TEXT_INDEX = "app/vectorstore/tds_index.faiss"
+TEXT_METADATA = "app/vectorstore/tds_metadata.json"
+TEXT_METADATA_STORE = "app/vectorstore/tds_metadata.bin"  # built by tdsembedder.py
+BM25_INDEX = "app/vectorstore/tds_bm25.npz"  # built by tdsembedder.py, same rows as the FAISS index
+TEXT_VERSION_FILE = "app/vectorstore/tds_version.json"  # written last by tdsembedder.py
+
+# Hybrid retrieval: fuse BM25 and vector rankings with reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Search-time knobs for IVF (nprobe) and HNSW (efSearch) indexes; default to
+# the values stored in <index>.params.json at build time
+FAISS_NPROBE = os.getenv("FAISS_NPROBE")
+FAISS_EF_SEARCH = os.getenv("FAISS_EF_SEARCH")
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_index_mmap(path):
+    """
+    Memory-maps the index file instead of copying it onto the heap. Falls back
+    to a normal read for index types this faiss build can't map.
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError as e:
+        print(f"mmap load failed for {path} ({e}), reading into memory")
+        return faiss.read_index(path)
+
+def load_search_index(path):
+    params = load_params(path)
+    return apply_search_params(
+        read_index_mmap(path),
+        nprobe=FAISS_NPROBE or params.get("nprobe"),
+        ef_search=FAISS_EF_SEARCH or params.get("ef_search")
+    )
+
+def _load_text_metadata():
+    if os.path.exists(TEXT_METADATA_STORE):
+        return MetadataStore(TEXT_METADATA_STORE)
+    return _load_json(TEXT_METADATA)
+
+def _text_metadata_path():
+    return TEXT_METADATA_STORE if os.path.exists(TEXT_METADATA_STORE) else TEXT_METADATA
+
+# Fingerprint of the files the loaded text index came from (see reload_if_changed)
+_loaded = {"version": None}
+
+def _load_text_index():
+    _loaded["version"] = text_store_fingerprint()
+    return load_search_index(TEXT_INDEX)
+
+# Index and metadata are loaded on first use (or by the warm-up task in main.py)
+index = lazy("text_index", _load_text_index)
+metadata = lazy("text_metadata", _load_text_metadata)
+bm25_index = lazy("bm25_index", lambda: BM25Index.load(BM25_INDEX) if os.path.exists(BM25_INDEX) else None)
+
+def vectorstore_fingerprint(*paths):
+    """
+    Cheap identity of the files a vector store was loaded from (size + mtime),
+    used to invalidate anything derived from search results when it is rebuilt.
+    """
+    parts = []
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+def text_store_fingerprint():
+    """
+    tdsembedder.py writes the version file after every other file of a build,
+    so only that file needs watching. Stores built before it existed fall back
+    to fingerprinting every file the text search reads.
+    """
+    if os.path.exists(TEXT_VERSION_FILE):
+        return vectorstore_fingerprint(TEXT_VERSION_FILE)
+    paths = [TEXT_INDEX, _text_metadata_path(), BM25_INDEX, ids_path(TEXT_METADATA_STORE), chunk_keys_path(TEXT_METADATA_STORE)]
+    return vectorstore_fingerprint(*(path for path in paths if os.path.exists(path)))
+
+VECTORSTORE_VERSION = text_store_fingerprint()
+
+def loaded_vectorstore_version():
+    """
+    Version of the text store being served: the fingerprint taken when the
+    index was loaded (the files on disk, before that).
+    """
+    return _loaded["version"] or VECTORSTORE_VERSION
+
+def labels_to_rows(labels):
+    """
+    FAISS labels are metadata rows, unless the index was built with stable ids
+    (incremental builds), in which case the metadata store maps them back.
+    """
+    rows = metadata.get()
+    if isinstance(rows, MetadataStore):
+        return rows.rows_for_labels(labels)
+    return labels
+
+def search_similar_chunks_batch(query_embeddings: np.ndarray, k=3):
+    """
+    Searches all query rows with one index.search call; returns one chunk list per row.
+    """
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+    D, I = index.get().search(query_embeddings, k)
+    rows = metadata.get()
+    results = []
+    for row_ids in labels_to_rows(I):
+        results.append([rows[idx] for idx in row_ids if idx >= 0])
+    return results
 
 def search_similar_chunks(query_embedding: np.ndarray, k=3):
-    D, I = index.search(query_embedding, k)
+    return search_similar_chunks_batch(query_embedding, k)[0]
+
+def hybrid_search_batch(query_texts, query_embeddings: np.ndarray, k=3):
+    """
+    Per query, fuses the top HYBRID_CANDIDATES vector hits with the top BM25
+    hits (exact tokens like "GA4" or "Podman") and returns the best k chunks.
+    Falls back to vector search when no BM25 index is present.
+    """
+    bm25 = bm25_index.get() if HYBRID_SEARCH else None
+    if bm25 is None:
+        return search_similar_chunks_batch(query_embeddings, k)
+
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+    D, I = index.get().search(query_embeddings, max(k, HYBRID_CANDIDATES))
+    rows = metadata.get()
     results = []
-    for idx in I[0]:
-        if idx >= 0:
-            results.append(metadata[idx])
-            # Optional: fetch neighbors here
+    for text, row_ids in zip(query_texts, labels_to_rows(I)):
+        vector_ranking = [int(idx) for idx in row_ids if idx >= 0]
+        lexical_ranking, _ = bm25.search(text, max(k, HYBRID_CANDIDATES))
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking.tolist()], k=RRF_K, limit=k)
+        results.append([rows[idx] for idx in fused])
     return results
 
 # Assuming these paths
 IMAGE_EMBEDDING_INDEX = "app/vectorstore/tds_imageembeddings.faiss"
 IMAGE_EMBEDDING_METADATA = "app/vectorstore/tds_image_metadata.json"
-TEXT_CHUNKS_FILE = "app/chunks/discourse_chunks.json"
+TEXT_CHUNKS_DIR = "app/chunks/discourse"  # JSONL shards written by tdsdischunker.py
+TEXT_CHUNKS_FILE = "app/chunks/discourse_chunks.json"  # legacy single-array format
+
+# Only needed for image requests
+image_index = lazy("image_index", lambda: load_search_index(IMAGE_EMBEDDING_INDEX), group="image")
+image_metadata = lazy("image_metadata", lambda: _load_json(IMAGE_EMBEDDING_METADATA), group="image")
+
+# Topic ids found for an image are only valid for this image index (see app/image_cache.py)
+IMAGE_VECTORSTORE_VERSION = (
+    vectorstore_fingerprint(IMAGE_EMBEDDING_INDEX, IMAGE_EMBEDDING_METADATA)
+    if os.path.exists(IMAGE_EMBEDDING_INDEX) else None
+)
 
-# Load index and metadata once (you can optimize with lazy loading)
-image_index = faiss.read_index(IMAGE_EMBEDDING_INDEX)
-with open(IMAGE_EMBEDDING_METADATA, "r", encoding="utf-8") as f:
-    image_metadata = json.load(f)
+# Memory-mapped chunk shards; chunks are decoded only when a topic is requested
+chunk_reader = lazy(
+    "chunk_reader",
+    lambda: ChunkReader(resolve_chunks_path(TEXT_CHUNKS_DIR, TEXT_CHUNKS_FILE)),
+    group="image"
+)
 
+def build_topic_index(reader):
+    """
+    Groups chunk refs by their flat 'topic_id', keeping file order (i.e. chunk_id order).
+    """
+    topic_index = {}
+    for ref, chunk in reader.refs():
+        topic_index.setdefault(str(chunk.get("topic_id", "")), []).append(ref)
+    return topic_index
 
-with open(TEXT_CHUNKS_FILE, "r", encoding="utf-8") as f:
-    all_chunks = json.load(f)
+# topic_id -> [chunk ref, ...], built once so image queries are a dict lookup
+topic_index = lazy("topic_index", lambda: build_topic_index(chunk_reader.get()), group="image")
+
+def chunk_key(chunk):
+    """
+    Identifies a chunk across discourse_chunks.json and tds_metadata.json.
+    """
+    return (chunk.get("url", ""), chunk.get("chunk_id", -1))
 
 def search_similar_image(clip_embedding, k=1):
     """
-    Searches for similar images and returns topic_id(s) extracted from filename.
+    Searches for similar images and returns their topic_id(s), from the metadata's
+    "topic_ids" or, for legacy rows, the filename prefix.
     """
     clip_embedding = np.array(clip_embedding).astype("float32")
-    distances, indices = image_index.search(clip_embedding, k)
-    topic_ids = set()
+    distances, indices = image_index.get().search(clip_embedding, k)
+    rows = image_metadata.get()
+    topic_ids = []
 
     for idx in indices[0]:
-        filename = image_metadata[idx]["filename"]
-        topic_id = filename.split("_")[0]  # Extract '141413' from '141413_img1.jpeg'
-        topic_ids.add(topic_id)
+        if idx < 0:
+            continue
+        row = rows[idx]
+        # Legacy rows: extract '141413' from '141413_img1.jpeg'
+        for topic_id in row.get("topic_ids") or [row["filename"].split("_")[0]]:
+            topic_id = str(topic_id)
+            if topic_id not in topic_ids:
+                topic_ids.append(topic_id)
 
-    return list(topic_ids)
+    return topic_ids
 
-def get_chunks_by_topic_id(topic_id):
+def get_chunks_by_topic_ids(topic_ids, max_per_topic=None):
     """
-    Returns all text chunks that belong to a specific topic ID.
-    Assumes each chunk dict has 'topic' key with 'id'.
+    Returns the text chunks of every given topic ID, in the order the IDs are given.
+    max_per_topic caps how many chunks (lowest chunk_id first) come from each topic.
     """
-    chunks = [
-        chunk for chunk in all_chunks
-        if str(chunk.get("topic", {}).get("id", "")) == str(topic_id)
-    ]
+    topics = topic_index.get()
+    reader = chunk_reader.get()
+    chunks = []
+    seen = set()
+    for topic_id in topic_ids:
+        topic_id = str(topic_id)
+        if topic_id in seen:
+            continue
+        seen.add(topic_id)
+        chunks.extend(reader.read(ref) for ref in topics.get(topic_id, [])[:max_per_topic])
     return chunks
+
+def build_neighbor_index(rows):
+    """
+    (url, chunk_id) -> row number in the text metadata, so the chunks around a
+    search hit are dict lookups.
+    """
+    neighbors = {}
+    for row_num, row in enumerate(rows):
+        neighbors.setdefault(chunk_key(row), row_num)
+    return neighbors
+
+# Only for metadata without a chunk keys file (tds_metadata.json, older builds).
+# Not in a warm-up group: it decodes every row, so it is built on the first
+# neighbour lookup, which only happens with CONTEXT_NEIGHBORS > 0
+neighbor_index = lazy("neighbor_index", lambda: build_neighbor_index(metadata.get()), group="neighbors")
+
+def find_chunk(url, chunk_id):
+    rows = metadata.get()
+    if isinstance(rows, MetadataStore) and rows.chunk_keys is not None:
+        return rows.find_chunk(url, chunk_id)
+    row_num = neighbor_index.get().get((url, chunk_id))
+    return None if row_num is None else rows[row_num]
+
+def get_neighbor_chunks(chunk, radius=1):
+    """
+    The indexed chunks up to `radius` chunk_ids before and after `chunk` in the
+    same document, nearest first.
+    """
+    url, chunk_id = chunk_key(chunk)
+    if chunk_id < 0:
+        return []
+    found = []
+    for distance in range(1, radius + 1):
+        for neighbor_id in (chunk_id - distance, chunk_id + distance):
+            neighbor = find_chunk(url, neighbor_id)
+            if neighbor is not None:
+                found.append(neighbor)
+    return found
+
+def get_chunks_by_topic_id(topic_id, max_chunks=None):
+    """
+    Returns all text chunks that belong to a specific topic ID.
+    """
+    return get_chunks_by_topic_ids([topic_id], max_per_topic=max_chunks)
+
+def reload_if_changed():
+    """
+    Drops the loaded text index, metadata and BM25 index when their files were
+    rebuilt since, so the next use (or warm-up) loads the new ones. Returns
+    True if they were dropped.
+    """
+    if _loaded["version"] is None:
+        return False
+    if text_store_fingerprint() == _loaded["version"]:
+        return False
+    for resource in (index, metadata, bm25_index, neighbor_index):
+        resource.reset()
+    _loaded["version"] = None
+    return True
@@ -0,0 +1,105 @@
+"""
+Recall@k and search latency of the ANN index types in app/ann_index.py,
+measured on the vectors of an existing flat index.
+
+    python benchmarks/ann_benchmark.py --index app/vectorstore/tds_index.faiss -k 3
+    python benchmarks/ann_benchmark.py --queries my_query_embeddings.npy --out ann.json
+
+Without --queries, queries are stored vectors plus a little Gaussian noise, so
+every query has near neighbours like a real paraphrased question would.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.ann_index import build_index, apply_search_params, reconstruct_all
+
+SEARCH_GRID = {
+    "flat": [{}],
+    "ivfflat": [{"nprobe": n} for n in (1, 2, 4, 8, 16, 32)],
+    "ivfpq": [{"nprobe": n} for n in (1, 2, 4, 8, 16, 32)],
+    "hnsw": [{"ef_search": e} for e in (16, 32, 64, 128, 256)],
+}
+
+def make_queries(vectors, n, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)
+    queries = vectors[rows] + rng.normal(0, noise, size=(len(rows), vectors.shape[1])).astype("float32")
+    return np.ascontiguousarray(queries, dtype="float32")
+
+def time_searches(index, queries, k):
+    """
+    Times one single-row search per query, like the API does per request.
+    """
+    latencies = []
+    results = []
+    for q in queries:
+        q = q.reshape(1, -1)
+        t0 = time.perf_counter()
+        _, I = index.search(q, k)
+        latencies.append(time.perf_counter() - t0)
+        results.append(I[0])
+    return np.array(results), np.array(latencies) * 1000
+
+def recall_at_k(approx, exact):
+    k = exact.shape[1]
+    return float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default="app/vectorstore/tds_index.faiss", help="flat index holding the vectors")
+    parser.add_argument("--queries", help=".npy file of query embeddings (default: noisy stored vectors)")
+    parser.add_argument("-n", "--num-queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(SEARCH_GRID), help="comma separated index types")
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads (API serves single queries)")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors = reconstruct_all(faiss.read_index(args.index))
+    if args.queries:
+        queries = np.ascontiguousarray(np.load(args.queries), dtype="float32")
+    else:
+        queries = make_queries(vectors, args.num_queries, args.noise)
+    print(f"{len(vectors)} vectors ({vectors.shape[1]}D), {len(queries)} queries, k={args.k}\n")
+
+    flat, _ = build_index(vectors, "flat")
+    exact, _ = time_searches(flat, queries, args.k)
+
+    rows = []
+    print(f"{'index':<10} {'setting':<16} {'build s':>8} {f'recall@{args.k}':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for index_type in args.types.split(","):
+        t0 = time.perf_counter()
+        index, params = build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - t0
+        for setting in SEARCH_GRID[index_type]:
+            apply_search_params(index, **setting)
+            approx, latencies = time_searches(index, queries, args.k)
+            row = {
+                "index_type": index_type,
+                "params": params,
+                "setting": setting,
+                "build_seconds": build_seconds,
+                "recall": recall_at_k(approx, exact),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99))
+            }
+            rows.append(row)
+            label = ",".join(f"{k}={v}" for k, v in setting.items()) or "-"
+            print(f"{index_type:<10} {label:<16} {build_seconds:>8.2f} {row['recall']:>10.3f} "
+                  f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+if __name__ == "__main__":
+    main()
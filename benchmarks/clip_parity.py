@@ -0,0 +1,112 @@
+"""
+Nearest-neighbour parity and latency of the CLIP backends in app/clip_encoder.py,
+against the float model the image index was built with.
+
+    python benchmarks/clip_parity.py --backends torch,int8,onnx --threads 2
+    python benchmarks/clip_parity.py --image-dir data_creation --onnx-path models/clip-vit-b-32-visual.int8.onnx
+
+Images are the ones listed in the image metadata (local_path, relative to
+--image-dir). Every backend embeds each of them; its top-k neighbours in
+tds_imageembeddings.faiss are compared with the float torch model's. Latency is
+per single image, as the API encodes them, after one warm-up call. Exits non-zero
+if a backend's top-1 agreement is under --min-top1.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import faiss
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.clip_encoder import load_clip_encoder, CLIP_ONNX_PATH
+
+REFERENCE = "torch"
+
+def load_images(meta_path, image_dir, n):
+    with open(meta_path, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    images = []
+    for row in rows:
+        path = os.path.join(image_dir, row["local_path"])
+        if os.path.exists(path):
+            with Image.open(path) as image:
+                images.append(image.convert("RGB"))
+        if len(images) >= n:
+            break
+    return images
+
+def embed_all(encoder, images):
+    """
+    Returns (embeddings, per-image latencies in ms).
+    """
+    encoder.encode(images[0])
+    vectors, latencies = [], []
+    for image in images:
+        t0 = time.perf_counter()
+        vectors.append(encoder.encode(image))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return np.concatenate(vectors).astype("float32"), np.array(latencies)
+
+def cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default="app/vectorstore/tds_imageembeddings.faiss")
+    parser.add_argument("--meta", default="app/vectorstore/tds_image_metadata.json")
+    parser.add_argument("--image-dir", default="data_creation", help="directory local_path is relative to")
+    parser.add_argument("--backends", default="torch,int8,onnx", help=f"comma separated; {REFERENCE} is always run")
+    parser.add_argument("--onnx-path", default=CLIP_ONNX_PATH)
+    parser.add_argument("--threads", type=int, default=1, help="intra-op threads per forward pass")
+    parser.add_argument("-n", "--num-images", type=int, default=100)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--min-top1", type=float, default=0.95)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    index = faiss.read_index(args.index)
+    images = load_images(args.meta, args.image_dir, args.num_images)
+    if not images:
+        sys.exit(f"❌ None of the images in {args.meta} exist under {args.image_dir}")
+    print(f"{len(images)} images, {index.ntotal} indexed, k={args.k}, {args.threads} threads\n")
+
+    backends = [REFERENCE] + [b for b in args.backends.split(",") if b != REFERENCE]
+    expected, rows = None, []
+    print(f"{'backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'cos min':>8} {'cos mean':>9} {'top1':>6} {f'top{args.k}':>6}")
+    for backend in backends:
+        encoder = load_clip_encoder(backend, threads=args.threads, onnx_path=args.onnx_path)
+        vectors, latencies = embed_all(encoder, images)
+        _, found = index.search(vectors, args.k)
+        if expected is None:
+            reference, expected = vectors, found
+        cosines = cosine(vectors, reference)
+        row = {
+            "backend": backend,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "cosine_min": float(cosines.min()),
+            "cosine_mean": float(cosines.mean()),
+            "top1_agreement": float(np.mean(found[:, 0] == expected[:, 0])),
+            "topk_overlap": float(np.mean([len(set(f) & set(e)) / args.k for f, e in zip(found, expected)]))
+        }
+        rows.append(row)
+        print(f"{backend:<8} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['cosine_min']:>8.4f} "
+              f"{row['cosine_mean']:>9.4f} {row['top1_agreement']:>6.3f} {row['topk_overlap']:>6.3f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    failing = [row["backend"] for row in rows if row["top1_agreement"] < args.min_top1]
+    if failing:
+        sys.exit(f"❌ Top-1 agreement under {args.min_top1} for: {', '.join(failing)}")
+    print(f"\n✅ Every backend finds the float model's nearest image (top-1 >= {args.min_top1})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Parity of the local embedding backend (app/local_embedder.py) with the Nomic API
+vectors stored in the FAISS index, plus its latency per batch size.
+
+    python benchmarks/embed_parity.py -n 200 --threads 4
+    python benchmarks/embed_parity.py --model-dir models/nomic-embed-text-v1.5 --min-cosine 0.99
+
+Sampled chunks are re-embedded locally as search_document and compared with
+their stored vectors: cosine similarity, and whether a search with the local
+vector finds the same top-k rows as one with the stored vector. Exits non-zero
+if the lowest cosine is under --min-cosine.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.ann_index import reconstruct_all, index_ids
+from app.metadata_store import MetadataStore
+from app.local_embedder import LocalEmbedder, LOCAL_EMBED_MODEL_DIR
+
+def sample_rows(index, store, n, seed=0):
+    """
+    Picks n index positions; returns (stored vectors, texts) in the same order.
+    """
+    vectors = reconstruct_all(index)
+    rng = np.random.default_rng(seed)
+    positions = np.sort(rng.choice(len(vectors), size=min(n, len(vectors)), replace=False))
+    ids = index_ids(index)
+    labels = ids[positions] if ids is not None else positions
+    rows = store.rows_for_labels(labels)
+    keep = rows >= 0
+    texts = [store[row]["text"] for row in rows[keep]]
+    return vectors[positions[keep]], texts
+
+def embed_in_batches(embedder, texts, batch_size):
+    """
+    Returns (vectors, seconds per batch).
+    """
+    vectors = []
+    latencies = []
+    for i in range(0, len(texts), batch_size):
+        t0 = time.perf_counter()
+        vectors.append(embedder.embed(texts[i:i + batch_size], "search_document"))
+        latencies.append(time.perf_counter() - t0)
+    return np.concatenate(vectors), np.array(latencies)
+
+def topk_agreement(index, stored, local, k):
+    _, expected = index.search(stored, k)
+    _, found = index.search(local, k)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default="app/vectorstore/tds_index.faiss", help="flat index holding API vectors")
+    parser.add_argument("--meta", default="app/vectorstore/tds_metadata.bin", help="metadata store of that index")
+    parser.add_argument("--model-dir", default=LOCAL_EMBED_MODEL_DIR)
+    parser.add_argument("-n", "--num-texts", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads (0 = all cores)")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    index = faiss.read_index(args.index)
+    store = MetadataStore(args.meta)
+    stored, texts = sample_rows(index, store, args.num_texts)
+    embedder = LocalEmbedder(args.model_dir, dimensionality=index.d, threads=args.threads)
+    print(f"{len(texts)} chunks from {args.index} ({index.d}D), model {embedder.model_path}\n")
+
+    embedder.embed(texts[:1], "search_document")  # first run allocates the session's buffers
+    local = None
+    latency_rows = []
+    print(f"{'batch':>6} {'ms/batch':>10} {'ms/text':>9} {'texts/s':>9}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        vectors, latencies = embed_in_batches(embedder, texts, batch_size)
+        local = vectors if local is None else local
+        row = {
+            "batch_size": batch_size,
+            "ms_per_batch": float(latencies.mean() * 1000),
+            "ms_per_text": float(latencies.sum() * 1000 / len(texts)),
+            "texts_per_second": float(len(texts) / latencies.sum())
+        }
+        latency_rows.append(row)
+        print(f"{batch_size:>6} {row['ms_per_batch']:>10.2f} {row['ms_per_text']:>9.2f} {row['texts_per_second']:>9.1f}")
+
+    # Both sides are unit length, so the row-wise dot product is the cosine
+    cosines = np.sum(stored * local, axis=1)
+    parity = {
+        "cosine_min": float(cosines.min()),
+        "cosine_p5": float(np.percentile(cosines, 5)),
+        "cosine_mean": float(cosines.mean()),
+        f"top{args.k}_agreement": topk_agreement(index, stored, local, args.k)
+    }
+    print("\n" + "\n".join(f"{name:<16} {value:.4f}" for name, value in parity.items()))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"parity": parity, "latency": latency_rows}, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if parity["cosine_min"] < args.min_cosine:
+        worst = int(cosines.argmin())
+        sys.exit(f"❌ Lowest cosine {parity['cosine_min']:.4f} < {args.min_cosine}: {texts[worst][:80]!r}")
+    print(f"\n✅ Local vectors match the stored ones (min cosine >= {args.min_cosine})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+End-to-end load test of the API server against local Nomic and Groq stubs.
+
+Starts stubs/nomic_stub.py, stubs/groq_stub.py and `uvicorn app.main:app`
+(pointed at the stubs through NOMIC_API_URL / GROQ_API_URL), replays the
+questions of a promptfoo-style YAML file at rising concurrency and reports
+throughput, p50/p95/p99 latency and the server's per-stage breakdown (taken from
+the Server-Timing header that "X-Profile: 1" turns on).
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --levels 1,4,16,64 --requests 200 --groq-latency 0.5
+    python benchmarks/loadtest.py --endpoint /ask/stream --image-ratio 0.3 --error-rate 0.02
+
+Results go to benchmarks/results/<git sha>.json and are compared with the most
+recent result of another commit (or --baseline), so regressions show up in review.
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+import numpy as np
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+STUBS_DIR = os.path.join(ROOT, "stubs")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_QUESTIONS = os.path.join(ROOT, "benchmarks", "questions.yaml")
+
+# --- inputs ---
+def load_questions(path):
+    """
+    Questions from a promptfoo-style file ({"tests": [{"vars": {"question": ...}}]})
+    or a plain YAML/JSON list of strings.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    if isinstance(data, dict):
+        data = data.get("tests", [])
+    questions = []
+    for item in data:
+        if isinstance(item, str):
+            questions.append(item)
+        elif isinstance(item, dict) and "question" in item.get("vars", {}):
+            questions.append(item["vars"]["question"])
+    if not questions:
+        sys.exit(f"No questions found in {path}")
+    return questions
+
+def load_images(image_dir):
+    """
+    base64 images to attach; with no directory, one synthetic screenshot-like PNG.
+    """
+    if image_dir:
+        paths = sorted(p for p in glob.glob(os.path.join(image_dir, "*"))
+                       if p.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+        if paths:
+            images = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    images.append(base64.b64encode(f.read()).decode("ascii"))
+            return images
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (800, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(["GA4 score: 10/10 + bonus", "Dashboard shows 110", "docker run -it podman"]):
+        draw.text((20, 20 + 40 * i), line, fill="black")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return [base64.b64encode(buf.getvalue()).decode("ascii")]
+
+def make_requests(questions, images, n, image_ratio, cold):
+    """
+    n request bodies cycling through the questions; every 1/image_ratio-th carries
+    an image. cold=True makes each question unique so the caches don't answer it.
+    """
+    bodies = []
+    image_every = round(1 / image_ratio) if image_ratio > 0 else 0
+    for i in range(n):
+        question = questions[i % len(questions)]
+        if cold:
+            question = f"{question} (load test {i})"
+        body = {"question": question}
+        if image_every and i % image_every == 0:
+            body["image"] = images[(i // image_every) % len(images)]
+        bodies.append(body)
+    return bodies
+
+# --- processes ---
+def start_process(args, env=None, log_path=None):
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_until(url, timeout, ok=(200,), method="GET"):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.request(method, url, timeout=5).status_code in ok:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def start_stack(args):
+    host = "127.0.0.1"
+    fault_args = ["--jitter", str(args.jitter), "--error-rate", str(args.error_rate)]
+    processes = [
+        start_process([os.path.join(STUBS_DIR, "nomic_stub.py"), "--port", str(args.nomic_port),
+                       "--latency", str(args.nomic_latency)] + fault_args),
+        start_process([os.path.join(STUBS_DIR, "groq_stub.py"), "--port", str(args.groq_port),
+                       "--latency", str(args.groq_latency), "--token-delay", str(args.token_delay),
+                       "--tokens", str(args.tokens)] + fault_args),
+    ]
+    env = dict(os.environ)
+    env.update({
+        "NOMIC_API_URL": f"http://{host}:{args.nomic_port}/v1/embedding/text",
+        "GROQ_API_URL": f"http://{host}:{args.groq_port}/openai/v1/chat/completions",
+        "NOMIC_API_KEY": env.get("NOMIC_API_KEY") or "stub",
+        "GROQ_API_KEY": env.get("GROQ_API_KEY") or "stub",
+        "IMAGE_ENABLED": "1" if args.image_ratio > 0 else "0",
+        "PYTHONPATH": ROOT,
+    })
+    if args.cold:
+        env["ANSWER_CACHE_ENABLED"] = "0"
+    server_cmd = ["-m", "uvicorn", "app.main:app", "--host", host, "--port", str(args.port), "--log-level", "warning"]
+    if args.workers > 1:
+        server_cmd += ["--workers", str(args.workers)]
+    processes.append(start_process(server_cmd, env=env, log_path=args.server_log))
+
+    base_url = f"http://{host}:{args.port}"
+    for url in (f"http://{host}:{args.nomic_port}/", f"http://{host}:{args.groq_port}/"):
+        if not wait_until(url, 20):
+            stop_stack(processes)
+            sys.exit(f"Stub at {url} did not start")
+    if not wait_until(f"{base_url}/warmup", args.startup_timeout, method="POST"):
+        stop_stack(processes)
+        sys.exit(f"Server did not become ready; see {args.server_log}")
+    return base_url, processes
+
+def stop_stack(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# --- load ---
+def parse_server_timing(value):
+    stages = {}
+    for part in (value or "").split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        if name and rest:
+            stages[name] = float(rest)
+    return stages
+
+async def send_one(client, endpoint, body):
+    """
+    Returns (latency s, ok, stages ms, time to first token s or None).
+    """
+    started = time.perf_counter()
+    headers = {"X-Profile": "1"}
+    try:
+        if endpoint == "/ask/stream":
+            first_token = None
+            stages = {}
+            ok = False
+            event = None
+            async with client.stream("POST", endpoint, json=body, headers=headers) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        if event == "token" and first_token is None:
+                            first_token = time.perf_counter() - started
+                        elif event == "done":
+                            ok = True
+                            stages = json.loads(line[len("data:"):]).get("profile_ms", {})
+            return time.perf_counter() - started, ok and response.status_code == 200, stages, first_token
+        response = await client.post(endpoint, json=body, headers=headers)
+        return (time.perf_counter() - started, response.status_code == 200,
+                parse_server_timing(response.headers.get("server-timing")), None)
+    except httpx.HTTPError:
+        return time.perf_counter() - started, False, {}, None
+
+async def run_level(base_url, endpoint, bodies, concurrency, timeout):
+    """
+    Closed loop: `concurrency` clients each send their next request as soon as
+    the previous one finished, until all bodies are sent.
+    """
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                body = queue.get_nowait()
+                results.append(await send_one(client, endpoint, body))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return summarize(results, concurrency, wall)
+
+def percentiles(values, scale=1000.0):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    arr = np.asarray(values) * scale
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+            "mean": round(float(arr.mean()), 1)}
+
+def summarize(results, concurrency, wall):
+    ok = [r for r in results if r[1]]
+    stage_names = sorted({name for r in ok for name in r[2]})
+    stages = {name: percentiles([r[2][name] for r in ok if name in r[2]], scale=1.0) for name in stage_names}
+    first_tokens = [r[3] for r in ok if r[3] is not None]
+    summary = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": percentiles([r[0] for r in ok]),
+        "stages_ms": stages,
+    }
+    if first_tokens:
+        summary["first_token_ms"] = percentiles(first_tokens)
+    return summary
+
+# --- reporting ---
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    sha = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return sha, dirty
+
+def print_level(level):
+    lat = level["latency_ms"]
+    line = (f"c={level['concurrency']:<4} {level['throughput_rps']:8.2f} req/s  "
+            f"p50 {lat['p50']} ms  p95 {lat['p95']} ms  p99 {lat['p99']} ms  errors {level['errors']}")
+    if "first_token_ms" in level:
+        line += f"  first token p50 {level['first_token_ms']['p50']} ms"
+    print(line)
+    if level["stages_ms"]:
+        print("       " + "  ".join(f"{name} {s['p50']}" for name, s in level["stages_ms"].items()) + "  (stage p50 ms)")
+
+def find_baseline(path, sha):
+    if path:
+        return path
+    candidates = [p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+                  if not os.path.basename(p).startswith(sha)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def compare(result, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config", {}).get("endpoint") != result["config"]["endpoint"]:
+        print(f"\n(baseline {baseline_path} used another endpoint, not comparing)")
+        return
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\nvs {baseline.get('git_sha')} ({os.path.relpath(baseline_path, ROOT)}):")
+    for level in result["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old or not old["latency_ms"]["p50"] or not level["latency_ms"]["p50"]:
+            continue
+        def delta(new, before):
+            return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"c={level['concurrency']:<4} throughput {delta(level['throughput_rps'], old['throughput_rps'])}  "
+              f"p50 {delta(level['latency_ms']['p50'], old['latency_ms']['p50'])}  "
+              f"p99 {delta(level['latency_ms']['p99'], old['latency_ms']['p99'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="promptfoo-style YAML or a list of questions")
+    parser.add_argument("--endpoint", default="/ask", choices=["/ask", "/ask/stream"])
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per concurrency level")
+    parser.add_argument("--image-ratio", type=float, default=0.0, help="fraction of requests that carry an image")
+    parser.add_argument("--images", help="directory of images to attach (default: one synthetic PNG)")
+    parser.add_argument("--warm", dest="cold", action="store_false",
+                        help="repeat questions verbatim so the embedding/answer caches can hit")
+    parser.add_argument("--nomic-latency", type=float, default=0.08)
+    parser.add_argument("--groq-latency", type=float, default=0.4, help="time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub responses that are 503s")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--nomic-port", type=int, default=8101)
+    parser.add_argument("--groq-port", type=int, default=8103)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--server-log", default=os.path.join(RESULTS_DIR, "server.log"))
+    parser.add_argument("--baseline", help="result file to compare with (default: latest of another commit)")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<sha>.json)")
+    args = parser.parse_args()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    questions = load_questions(args.questions)
+    images = load_images(args.images) if args.image_ratio > 0 else []
+    levels = [int(level) for level in args.levels.split(",")]
+
+    base_url, processes = start_stack(args)
+    try:
+        print(f"Server ready at {base_url}; {len(questions)} questions, {args.requests} requests per level, "
+              f"endpoint {args.endpoint}, images {args.image_ratio:.0%}\n")
+        results = []
+        for i, concurrency in enumerate(levels):
+            bodies = make_requests(questions, images, args.requests, args.image_ratio, args.cold)
+            if args.cold:  # unique per level too, so no level warms the next one's caches
+                bodies = [dict(body, question=f"{body['question']} L{i}") for body in bodies]
+            level = asyncio.run(run_level(base_url, args.endpoint, bodies, concurrency, args.timeout))
+            print_level(level)
+            results.append(level)
+        server_metrics = httpx.get(f"{base_url}/metrics", timeout=10).text
+    finally:
+        stop_stack(processes)
+
+    sha, dirty = git_revision()
+    result = {
+        "git_sha": sha,
+        "git_dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("out", "baseline", "server_log")},
+        "levels": results,
+        "cache_metrics": [line for line in server_metrics.splitlines() if line.startswith("cache_")],
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{sha}{'-dirty' if dirty else ''}.json")
+    baseline = find_baseline(args.baseline, sha)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {out}")
+    if baseline and os.path.abspath(baseline) != os.path.abspath(out):
+        compare(result, baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.chunk_io import ShardWriter, encode_chunk, SHARD_MAX_LINES
+
+# Streaming, parallel chunking shared by tdschunker.py and tdsdischunker.py.
+#
+# Each source file is chunked in a worker process (so memory is bounded by one
+# file per worker) and its chunks are appended to JSONL shards in source order.
+# state.json next to the shards records, per source, the hash it was chunked from
+# and the byte span of its chunks; an unchanged source is copied over from the
+# previous shards without being read or split again.
+STATE_FILE = "state.json"
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", str(os.cpu_count() or 1)))
+CHUNK_WINDOW = int(os.environ.get("CHUNK_WINDOW", "0"))  # files in flight; 0 = 2 per worker
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_state(out_dir, params):
+    """
+    The previous run's per-source spans, or {} if there is none or the chunk
+    settings changed since.
+    """
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("params") != params:
+        return {}
+    return state.get("sources", {})
+
+def _chunk_file(task):
+    chunk_fn, path = task
+    chunks = chunk_fn(path)
+    return b"".join(encode_chunk(chunk) for chunk in chunks), len(chunks)
+
+def chunked_files(pool, tasks, window):
+    """
+    Yields _chunk_file results in task order, keeping at most `window` files in
+    flight so finished results don't pile up ahead of the writer.
+    """
+    pending = deque()
+    tasks = iter(tasks)
+    for task in tasks:
+        pending.append(pool.submit(_chunk_file, task))
+        if len(pending) >= window:
+            break
+    while pending:
+        future = pending.popleft()
+        next_task = next(tasks, None)
+        if next_task is not None:
+            pending.append(pool.submit(_chunk_file, next_task))
+        yield future.result()
+
+def _read_span(out_dir, span):
+    with open(os.path.join(out_dir, span["shard"]), "rb") as f:
+        f.seek(span["start"])
+        return f.read(span["end"] - span["start"])
+
+def run_chunking(sources, chunk_fn, out_dir, params, workers=CHUNK_WORKERS, max_lines=SHARD_MAX_LINES,
+                 window=CHUNK_WINDOW):
+    """
+    sources: [(name, path, sha256)] in output order. chunk_fn(path) -> [chunk dict]
+    must be a module-level function (it runs in the worker processes).
+    Replaces out_dir with the new shards; returns (chunks, re-chunked, reused).
+    """
+    previous = load_state(out_dir, params)
+    todo = [(name, path) for name, path, sha in sources if previous.get(name, {}).get("sha256") != sha]
+    changed = {name for name, _ in todo}
+
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    writer = ShardWriter(tmp_dir, max_lines)
+    spans = {}
+
+    workers = max(1, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Results come back in submission order, i.e. the order of `sources`
+        results = chunked_files(pool, ((chunk_fn, path) for _, path in todo), window or 2 * workers)
+        for name, path, sha in sources:
+            if name in changed:
+                blob, count = next(results)
+            else:
+                span = previous[name]
+                blob, count = (_read_span(out_dir, span) if span["chunks"] else b""), span["chunks"]
+            if count:
+                shard, start, end = writer.write_lines(blob, count)
+                spans[name] = {"sha256": sha, "shard": shard, "start": start, "end": end, "chunks": count}
+            else:
+                spans[name] = {"sha256": sha, "shard": None, "start": 0, "end": 0, "chunks": 0}
+            writer.end_group()
+    total = writer.close()
+
+    with open(os.path.join(tmp_dir, STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump({"params": params, "sources": spans}, f, indent=2)
+
+    old_dir = out_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return total, len(changed), len(sources) - len(changed)
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import random
+import time
+import httpx
+
+# Concurrent, rate-limit-aware batch embedding for the offline builds.
+#
+# Several batches are in flight at once. Concurrency follows AIMD: it grows by one
+# after a run of fast successes and halves on a 429 (or when latency degrades).
+# Failed batches are retried with exponential backoff + jitter, honouring
+# Retry-After. Every finished batch is handed to on_batch_done right away, so the
+# caller can checkpoint it (tdsembedder.py commits it to the embedding store) and
+# a crashed run resumes where it stopped.
+
+NOMIC_API_URL = os.environ.get("NOMIC_API_URL", "https://api-atlas.nomic.ai/v1/embedding/text")
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited (429)")
+        self.retry_after = retry_after
+
+class NomicBatchEmbedder:
+    """
+    Calls the Nomic text embedding endpoint (or a local stub at NOMIC_API_URL).
+    """
+    def __init__(self, model, dimensionality, api_key, url=NOMIC_API_URL, task_type="search_document", timeout=120):
+        self.model = model
+        self.dimensionality = dimensionality
+        self.url = url
+        self.task_type = task_type
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=64))
+
+    async def __call__(self, texts):
+        payload = {
+            "model": self.model,
+            "texts": texts,
+            "task_type": self.task_type,
+            "dimensionality": self.dimensionality
+        }
+        response = await self.client.post(self.url, headers=self.headers, json=payload)
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise RateLimited(float(retry_after) if retry_after else None)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class EmbedScheduler:
+    def __init__(self, embed_batch, initial_concurrency=4, min_concurrency=1, max_concurrency=16,
+                 max_retries=8, base_delay=1.0, max_delay=60.0, increase_after=4, slow_factor=3.0,
+                 report_every=10.0):
+        self.embed_batch = embed_batch
+        self.concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.increase_after = increase_after
+        self.slow_factor = slow_factor
+        self.report_every = report_every
+
+        self.in_flight = 0
+        self.successes_since_change = 0
+        self.latency_ewma = None
+        self.stats = {"batches": 0, "texts": 0, "retries": 0, "rate_limited": 0, "failed_batches": 0}
+        self._cond = None
+
+    # --- concurrency limiter (limit can change while batches are running) ---
+    async def _acquire(self):
+        async with self._cond:
+            while self.in_flight >= self.concurrency:
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def _release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _decrease(self, reason):
+        new = max(self.min_concurrency, self.concurrency // 2)
+        if new != self.concurrency:
+            print(f"⬇️ Concurrency {self.concurrency} -> {new} ({reason})")
+        self.concurrency = new
+        self.successes_since_change = 0
+
+    def _on_success(self, latency):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        if latency > self.slow_factor * self.latency_ewma:
+            self._decrease(f"latency {latency:.1f}s vs {self.latency_ewma:.1f}s")
+        else:
+            self.successes_since_change += 1
+            if self.successes_since_change >= self.increase_after and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self.successes_since_change = 0
+        self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0)
+
+    async def _run_batch(self, keys, texts, on_batch_done):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            t0 = time.perf_counter()
+            try:
+                vectors = await self.embed_batch(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Got {len(vectors)} embeddings for {len(texts)} texts")
+            except RateLimited as e:
+                self.stats["rate_limited"] += 1
+                self._decrease("429")
+                delay = self._backoff(attempt, e.retry_after)
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if status and 400 <= status < 500 and status != 408:
+                    raise  # bad key / bad request: retrying won't help
+                delay = self._backoff(attempt)
+                print(f"⚠️ Batch failed ({e!r}), attempt {attempt + 1}/{self.max_retries + 1}")
+            else:
+                self._on_success(time.perf_counter() - t0)
+                on_batch_done(keys, vectors)
+                self.stats["batches"] += 1
+                self.stats["texts"] += len(texts)
+                return True
+            finally:
+                await self._release()
+
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+        self.stats["failed_batches"] += 1
+        print(f"❌ Giving up on a batch of {len(texts)} texts after {self.max_retries} retries")
+        return False
+
+    async def _report(self, started, total):
+        while True:
+            await asyncio.sleep(self.report_every)
+            elapsed = time.perf_counter() - started
+            print(f"📈 {self.stats['texts']}/{total} texts, {self.stats['texts'] / elapsed:.1f} texts/s, "
+                  f"concurrency {self.concurrency}, in flight {self.in_flight}")
+
+    async def run(self, batches, on_batch_done):
+        """
+        batches: list of (keys, texts). on_batch_done(keys, vectors) is called
+        once per finished batch. Returns the stats dict (with texts_per_second).
+        """
+        self._cond = asyncio.Condition()
+        total = sum(len(texts) for _, texts in batches)
+        started = time.perf_counter()
+        reporter = asyncio.create_task(self._report(started, total))
+        try:
+            await asyncio.gather(*(self._run_batch(keys, texts, on_batch_done) for keys, texts in batches))
+        finally:
+            reporter.cancel()
+
+        elapsed = time.perf_counter() - started
+        self.stats["seconds"] = elapsed
+        self.stats["texts_per_second"] = self.stats["texts"] / elapsed if elapsed else 0.0
+        self.stats["final_concurrency"] = self.concurrency
+        return self.stats
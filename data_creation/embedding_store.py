@@ -0,0 +1,68 @@
+import hashlib
+import sqlite3
+import numpy as np
+
+# Content-addressed embedding store for the offline builds.
+# Vectors are keyed by a hash of (model, dimensionality, text), so a rerun only
+# pays for chunks whose text is new or changed.
+
+def content_key(text, model, dimensionality):
+    raw = f"{model}|{dimensionality}|{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def stable_id(*parts):
+    """
+    63-bit id (FAISS labels are int64) derived from the given parts.
+    """
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+class EmbeddingStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """
+        Returns {key: float32 vector} for the keys that are stored.
+        """
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, keys, vectors):
+        """
+        Stores one batch and commits, so a crashed run keeps every finished batch.
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, np.asarray(vec, dtype="float32").tobytes()) for key, vec in zip(keys, vectors)]
+        )
+        self.conn.commit()
+
+    def prune(self, keep_keys):
+        """
+        Drops vectors whose key is no longer used. Returns how many were removed.
+        """
+        keep_keys = set(keep_keys)
+        stale = [key for (key,) in self.conn.execute("SELECT key FROM embeddings") if key not in keep_keys]
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key in stale])
+        self.conn.commit()
+        return len(stale)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
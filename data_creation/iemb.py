@@ -1,67 +1,196 @@
 import os
+import sys
 import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import faiss
 from PIL import Image
 import torch
 import open_clip
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.ann_index import build_index, save_index
+from embedding_store import EmbeddingStore, content_key
+
 # --- Config ---
 IMAGE_DIR = "scraped_images"
 OUTPUT_INDEX = "vectorstore/tds_imageembeddings.faiss"
 OUTPUT_METADATA = "vectorstore/tds_image_metadata.json"
+IMAGE_TOPIC_MAP = "image_topic_map.json"  # written by imagescraper.py
+EMBED_STORE = "vectorstore/tds_image_embeddings.sqlite"  # CLIP vectors keyed by image file hash
 
-# --- Setup ---
-os.makedirs("vectorstore", exist_ok=True)
+CLIP_MODEL = "ViT-B-32"
+CLIP_PRETRAINED = "openai"
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='openai')
-model = model.to(device)
-model.eval()
+# Index type: flat | ivfflat | ivfpq | hnsw (see app/ann_index.py)
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat")
+INDEX_PARAMS = json.loads(os.environ.get("INDEX_PARAMS", "{}"))
 
-# --- Helper to embed image ---
-def embed_image(image_path):
-    image = Image.open(image_path).convert("RGB")
-    image_tensor = preprocess(image).unsqueeze(0).to(device)
-    with torch.no_grad():
-        embedding = model.encode_image(image_tensor)
-    return embedding.cpu().numpy().astype("float32")[0]
+# Decode/preprocess runs in NUM_WORKERS processes; the model sees BATCH_SIZE images at a time
+BATCH_SIZE = int(os.environ.get("IEMB_BATCH_SIZE", "32"))
+NUM_WORKERS = int(os.environ.get("IEMB_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+TORCH_THREADS = int(os.environ.get("IEMB_TORCH_THREADS", str(os.cpu_count() or 1)))
+
+SKIP_EXTENSIONS = [".svg", ".avif"]
 
-# --- Main loop ---
-embeddings = []
-metadata = []
+# --- Helpers ---
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-for filename in os.listdir(IMAGE_DIR):
-    filepath = os.path.join(IMAGE_DIR, filename)
-    ext = os.path.splitext(filename)[-1].lower()
+_preprocess = None
 
-    if ext in [".svg", ".avif"]:
-        print(f"⚠️ Skipping unsupported format: {filename}")
-        continue
+def _init_worker(preprocess):
+    global _preprocess
+    _preprocess = preprocess
+    torch.set_num_threads(1)  # one decode per process, leave the cores to the pool
 
+def load_and_preprocess(path):
+    """
+    Runs in a worker: returns (tensor as numpy, None) or (None, error message).
+    """
     try:
-        vec = embed_image(filepath)
-        embeddings.append(vec)
+        with Image.open(path) as image:
+            return _preprocess(image.convert("RGB")).numpy(), None
+    except Exception as e:
+        return None, str(e)
+
+def preprocessed_images(pool, paths, window):
+    """
+    Yields (path, array, error) in order, keeping at most `window` images in flight
+    so decoded tensors don't pile up while the model is busy.
+    """
+    pending = deque()
+    paths = iter(paths)
+    for path in paths:
+        pending.append((path, pool.submit(load_and_preprocess, path)))
+        if len(pending) >= window:
+            break
+    while pending:
+        path, future = pending.popleft()
+        next_path = next(paths, None)
+        if next_path is not None:
+            pending.append((next_path, pool.submit(load_and_preprocess, next_path)))
+        array, error = future.result()
+        yield path, array, error
+
+def load_topic_ids():
+    """
+    filename -> list of topic ids, from the image-topic map (empty if missing).
+    """
+    if not os.path.exists(IMAGE_TOPIC_MAP):
+        return {}
+    with open(IMAGE_TOPIC_MAP, "r", encoding="utf-8") as f:
+        image_topic_map = json.load(f)
+    return {
+        filename: entry.get("topic_ids") or [str(entry["topic_id"])]
+        for filename, entry in image_topic_map.items()
+    }
+
+def embed_batch(model, device, arrays):
+    batch = torch.from_numpy(np.stack(arrays)).to(device)
+    with torch.no_grad():
+        return model.encode_image(batch).cpu().numpy().astype("float32")
+
+# --- Main ---
+def main():
+    os.makedirs("vectorstore", exist_ok=True)
+    torch.set_num_threads(TORCH_THREADS)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, _, preprocess = open_clip.create_model_and_transforms(CLIP_MODEL, pretrained=CLIP_PRETRAINED)
+    model = model.to(device)
+    model.eval()
 
-        metadata.append({
+    files = []
+    for filename in sorted(os.listdir(IMAGE_DIR)):
+        if os.path.splitext(filename)[-1].lower() in SKIP_EXTENSIONS:
+            print(f"⚠️ Skipping unsupported format: {filename}")
+            continue
+        files.append(filename)
+
+    paths = {filename: os.path.join(IMAGE_DIR, filename) for filename in files}
+    model_tag = f"{CLIP_MODEL}/{CLIP_PRETRAINED}"
+
+    # Unchanged images (same bytes) reuse their stored embedding
+    with ProcessPoolExecutor(NUM_WORKERS) as pool:
+        hashes = dict(zip(files, pool.map(file_hash, [paths[f] for f in files], chunksize=16)))
+    keys = {filename: content_key(hashes[filename], model_tag, "image") for filename in files}
+
+    store = EmbeddingStore(EMBED_STORE)
+    stored = store.get_many(set(keys.values()))
+    todo = []
+    queued = set()
+    for filename in files:
+        key = keys[filename]
+        if key not in stored and key not in queued:  # byte-identical files are embedded once
+            queued.add(key)
+            todo.append(filename)
+    print(f"🖼️ {len(files)} images: {len(files) - len(todo)} reused, {len(todo)} to embed "
+          f"({NUM_WORKERS} workers, batch {BATCH_SIZE}, {device})")
+
+    failed = set()
+    batch_files, batch_arrays = [], []
+
+    def flush():
+        vectors = embed_batch(model, device, batch_arrays)
+        batch_keys = [keys[f] for f in batch_files]
+        store.put_many(batch_keys, vectors)
+        stored.update(zip(batch_keys, vectors))
+        print(f"✅ Embedded batch of {len(batch_files)} ({len(stored)} total)")
+        batch_files.clear()
+        batch_arrays.clear()
+
+    with ProcessPoolExecutor(NUM_WORKERS, initializer=_init_worker, initargs=(preprocess,)) as pool:
+        window = NUM_WORKERS * BATCH_SIZE * 2
+        for path, array, error in preprocessed_images(pool, [paths[f] for f in todo], window):
+            filename = os.path.basename(path)
+            if error is not None:
+                print(f"❌ Failed to embed {filename}: {error}")
+                failed.add(filename)
+                continue
+            batch_files.append(filename)
+            batch_arrays.append(array)
+            if len(batch_files) >= BATCH_SIZE:
+                flush()
+        if batch_files:
+            flush()
+
+    # --- Save results ---
+    embeddings = []
+    metadata = []
+    topic_ids = load_topic_ids()
+    for filename in files:
+        key = keys[filename]
+        if filename in failed or key not in stored:
+            continue
+        embeddings.append(stored[key])
+        row = {
             "filename": filename,
-            "local_path": filepath.replace("\\", "/")
-        })
+            "local_path": paths[filename].replace("\\", "/")
+        }
+        if filename in topic_ids:
+            row["topic_ids"] = topic_ids[filename]
+        metadata.append(row)
 
-        print(f"✅ Embedded: {filename}")
-    except Exception as e:
-        print(f"❌ Failed to embed {filename}: {e}")
+    store.prune(keys.values())
+    store.close()
+
+    if embeddings:
+        vecs_np = np.stack(embeddings)
+        index, index_params = build_index(vecs_np, INDEX_TYPE, **INDEX_PARAMS)
+        save_index(index, OUTPUT_INDEX, index_params)
 
-# --- Save results ---
-if embeddings:
-    vecs_np = np.stack(embeddings)
-    index = faiss.IndexFlatL2(vecs_np.shape[1])
-    index.add(vecs_np)
-    faiss.write_index(index, OUTPUT_INDEX)
+        with open(OUTPUT_METADATA, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
 
-    with open(OUTPUT_METADATA, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+        print(f"\n💾 Saved {len(embeddings)} image embeddings to {OUTPUT_INDEX} ({len(failed)} skipped)")
+    else:
+        print("⚠️ No embeddings were generated.")
 
-    print(f"\n💾 Saved {len(embeddings)} image embeddings to {OUTPUT_INDEX}")
-else:
-    print("⚠️ No embeddings were generated.")
+if __name__ == "__main__":
+    main()
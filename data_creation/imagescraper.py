@@ -2,16 +2,24 @@
 import os
 import json
 import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
 from playwright.sync_api import sync_playwright
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ===== CONFIG =====
 TOPIC_LIST_FILE = "filtered_topics.json"
 IMAGE_OUTPUT_DIR = "scraped_images"
 OUTPUT_MAP_FILE = "image_topic_map.json"
+URL_INDEX_FILE = "image_url_index.json"  # image URL -> content-hash filename, so reruns skip known URLs
 SCROLL_DELAY = 2  # optional if you want to scroll like in your post scraper
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_TIMEOUT = 30
 
 # ===== UTILS =====
 def ensure_dir(path):
@@ -21,20 +29,91 @@ def ensure_dir(path):
 def sanitize_filename(name):
     return re.sub(r'[<>:"/\\|?*]', "_", name)
 
-def download_image(url, path):
-    try:
-        r = requests.get(url)
-        if r.status_code == 200:
-            with open(path, "wb") as f:
+def make_session(workers=DOWNLOAD_WORKERS):
+    """
+    One pooled session shared by all download threads (keep-alive + retries).
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def load_url_index():
+    if os.path.exists(URL_INDEX_FILE):
+        with open(URL_INDEX_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+class ImageDownloader:
+    """
+    Downloads images on a bounded thread pool. Files are named by the sha256 of
+    their bytes, so the same image posted in several places is stored once.
+    """
+    def __init__(self, output_dir, url_index, workers=DOWNLOAD_WORKERS):
+        self.output_dir = output_dir
+        self.url_index = url_index
+        self.session = make_session(workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.stats = {"downloaded": 0, "skipped": 0, "duplicates": 0, "failed": 0}
+
+    def submit(self, url):
+        return self.executor.submit(self.download, url)
+
+    def download(self, url):
+        """
+        Returns the content-hash filename for url, or None if it could not be fetched.
+        """
+        with self.lock:
+            filename = self.url_index.get(url)
+        if filename and os.path.exists(os.path.join(self.output_dir, filename)):
+            self._count("skipped")
+            return filename
+
+        try:
+            r = self.session.get(url, timeout=DOWNLOAD_TIMEOUT)
+        except Exception as e:
+            print(f"❌ Exception downloading {url}: {e}")
+            self._count("failed")
+            return None
+        if r.status_code != 200:
+            print(f"❌ Failed ({r.status_code}) {url}")
+            self._count("failed")
+            return None
+
+        ext = os.path.splitext(urlparse(url).path)[-1].lower() or ".jpg"
+        filename = hashlib.sha256(r.content).hexdigest()[:32] + ext
+        path = os.path.join(self.output_dir, filename)
+        if os.path.exists(path):
+            self._count("duplicates")
+        else:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
                 f.write(r.content)
+            os.replace(tmp_path, path)
+            self._count("downloaded")
             print(f"✅ Saved: {path}")
-        else:
-            print(f"❌ Failed ({r.status_code}) {url}")
-    except Exception as e:
-        print(f"❌ Exception downloading {url}: {e}")
+
+        with self.lock:
+            self.url_index[url] = filename
+        return filename
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
 
 # ===== SCRAPER =====
-def scrape_images_from_topic(page, topic, image_topic_map):
+def scrape_images_from_topic(page, topic, downloader, pending):
+    """
+    Collects the topic's image URLs and queues them on the downloader; the page
+    loop moves on to the next topic while they download.
+    """
     topic_id = topic["id"]
     topic_title = sanitize_filename(topic["title"]).replace(" ", "_")
     topic_url = topic["link"]
@@ -51,34 +130,47 @@ def scrape_images_from_topic(page, topic, image_topic_map):
 
         page.wait_for_selector("img", timeout=10000)
         images = page.query_selector_all("img")
-        saved_count = 0
+        queued = set()
 
-        for i, img in enumerate(images):
+        for img in images:
             src = img.get_attribute("src")
             if not src or "emoji" in src or "avatar" in src:
                 continue
 
             full_url = urljoin(topic_url, src)
-            ext = os.path.splitext(urlparse(full_url).path)[-1] or ".jpg"
-            filename = f"{topic_id}_img{i+1}{ext}"
-            filepath = os.path.join(IMAGE_OUTPUT_DIR, filename)
+            if full_url in queued:
+                continue
+            queued.add(full_url)
+            pending.append((topic, downloader.submit(full_url)))
+
+        print(f"📷 {len(queued)} images queued for topic {topic_id}")
 
-            download_image(full_url, filepath)
+    except Exception as e:
+        print(f"❌ Error scraping topic {topic_id}: {e}")
 
+def build_image_topic_map(pending):
+    """
+    filename -> topic info. An image shared by several topics keeps the first
+    topic's fields and lists every topic in "topic_ids".
+    """
+    image_topic_map = {}
+    for topic, future in pending:
+        filename = future.result()
+        if filename is None:
+            continue
+        entry = image_topic_map.get(filename)
+        if entry is None:
             image_topic_map[filename] = {
-                "topic_id": topic_id,
+                "topic_id": topic["id"],
+                "topic_ids": [str(topic["id"])],
                 "title": topic["title"],
                 "link": topic["link"],
                 "date": topic["date"],
-                "local_path": filepath.replace("\\", "/")
+                "local_path": os.path.join(IMAGE_OUTPUT_DIR, filename).replace("\\", "/")
             }
-
-            saved_count += 1
-
-        print(f"📷 {saved_count} images saved for topic {topic_id}")
-
-    except Exception as e:
-        print(f"❌ Error scraping topic {topic_id}: {e}")
+        elif str(topic["id"]) not in entry["topic_ids"]:
+            entry["topic_ids"].append(str(topic["id"]))
+    return image_topic_map
 
 # ===== MAIN =====
 def scrape_all_images():
@@ -95,26 +187,35 @@ def scrape_all_images():
         if start_date <= datetime.strptime(t["date"], "%Y-%m-%d") <= end_date
     ]
 
-    image_topic_map = {}
+    downloader = ImageDownloader(IMAGE_OUTPUT_DIR, load_url_index())
+    pending = []
+
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch_persistent_context(user_data_dir="user_data", headless=False)
+            page = browser.new_page()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch_persistent_context(user_data_dir="user_data", headless=False)
-        page = browser.new_page()
+            input("⏸️ Log in manually if needed, then press ENTER to start scraping images...")
 
-        input("⏸️ Log in manually if needed, then press ENTER to start scraping images...")
+            for topic in filtered_topics:
+                try:
+                    scrape_images_from_topic(page, topic, downloader, pending)
+                except Exception as e:
+                    print(f"❌ Skipping {topic['id']} due to error: {e}")
 
-        for topic in filtered_topics:
-            try:
-                scrape_images_from_topic(page, topic, image_topic_map)
-            except Exception as e:
-                print(f"❌ Skipping {topic['id']} due to error: {e}")
+            browser.close()
 
-        browser.close()
+        image_topic_map = build_image_topic_map(pending)
+    finally:
+        downloader.close()
+        with open(URL_INDEX_FILE, "w", encoding="utf-8") as f:
+            json.dump(downloader.url_index, f, indent=2)
 
     with open(OUTPUT_MAP_FILE, "w", encoding="utf-8") as f:
         json.dump(image_topic_map, f, indent=2)
 
-    print(f"\n📝 Image-topic map saved to {OUTPUT_MAP_FILE}")
+    print(f"\n📊 Downloads: {downloader.stats}")
+    print(f"📝 Image-topic map saved to {OUTPUT_MAP_FILE} ({len(image_topic_map)} unique images)")
 
 if __name__ == "__main__":
     scrape_all_images()
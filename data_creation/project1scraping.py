@@ -1,48 +1,139 @@
 import requests
 import os
 import re
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 BASE_URL = "https://tds.s-anand.net/2025-01/"
 SIDEBAR_URL = urljoin(BASE_URL, "_sidebar.md")
 SAVE_DIR = "tds_content"
+# filename -> url, ETag, Last-Modified and sha256 of each saved file; read by tdschunker.py
+MANIFEST_FILE = os.path.join(SAVE_DIR, "manifest.json")
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "8"))
+REQUEST_TIMEOUT = 30
 
-print(f"Fetching sidebar from {SIDEBAR_URL}...")
-response = requests.get(SIDEBAR_URL)
+def make_session(workers=FETCH_WORKERS):
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-if response.status_code != 200:
-    print(f"❌ Failed to fetch sidebar.md (status {response.status_code})")
-    exit()
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
 
-sidebar_md = response.text
-print("Raw sidebar markdown:")
-print(sidebar_md[:500], "..." if len(sidebar_md) > 500 else "")
+def save_manifest(manifest):
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_FILE)
 
-# Regex: match any .md link inside parentheses
-links = re.findall(r'\((.*?)\.md\)', sidebar_md)
-# add '.md' back to matches, remove duplicates
-links = list(set(link + ".md" for link in links))
+def fetch_file(session, url, filename, entry):
+    """
+    Conditional GET for one file. Returns (status, manifest entry) where status is
+    "changed", "unchanged" (304 or identical bytes) or "failed".
+    """
+    path = os.path.join(SAVE_DIR, filename)
+    headers = {}
+    if entry and os.path.exists(path):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
 
-print(f"✅ Found {len(links)} markdown files:")
+    try:
+        res = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    except Exception as e:
+        print(f"❌ Exception downloading {url}: {e}")
+        return "failed", entry
+    if res.status_code == 304:
+        return "unchanged", entry
+    if res.status_code != 200:
+        print(f"❌ Failed to download {url} (status {res.status_code})")
+        return "failed", entry
 
-for l in links:
-    print(" -", l)
+    res.encoding = res.encoding or "utf-8"
+    text = res.text
+    sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    new_entry = {
+        "url": url,
+        "etag": res.headers.get("ETag"),
+        "last_modified": res.headers.get("Last-Modified"),
+        "sha256": sha256
+    }
+    if entry and entry.get("sha256") == sha256 and os.path.exists(path):
+        return "unchanged", new_entry  # server ignored the validators but nothing changed
 
-os.makedirs(SAVE_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"✅ Saved {path}")
+    return "changed", new_entry
 
-for link in links:
-    # resolve relative url
-    url = urljoin(BASE_URL, link)
-    filename = os.path.join(SAVE_DIR, os.path.basename(link))
-    print(f"⬇️ Downloading {url} -> {filename} ...")
+def fetch_all(links, workers=FETCH_WORKERS):
+    manifest = load_manifest()
+    session = make_session(workers)
+    counts = {"changed": 0, "unchanged": 0, "failed": 0}
+    new_manifest = {}
 
-    res = requests.get(url)
-    if res.status_code == 200:
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(res.text)
-        print(f"✅ Saved {filename}")
-    else:
-        print(f"❌ Failed to download {url} (status {res.status_code})")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for link in links:
+            # resolve relative url
+            url = urljoin(BASE_URL, link)
+            filename = os.path.basename(link)
+            futures[executor.submit(fetch_file, session, url, filename, manifest.get(filename))] = filename
+        for future in as_completed(futures):
+            filename = futures[future]
+            status, entry = future.result()
+            counts[status] += 1
+            if entry:
+                new_manifest[filename] = entry
+    session.close()
+
+    # Files that dropped out of the sidebar are removed so they aren't chunked again
+    for filename in set(manifest) - set(new_manifest):
+        path = os.path.join(SAVE_DIR, filename)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"🗑️ Removed {path} (no longer in the sidebar)")
+
+    save_manifest(new_manifest)
+    return counts
+
+if __name__ == "__main__":
+    print(f"Fetching sidebar from {SIDEBAR_URL}...")
+    response = requests.get(SIDEBAR_URL, timeout=REQUEST_TIMEOUT)
+
+    if response.status_code != 200:
+        print(f"❌ Failed to fetch sidebar.md (status {response.status_code})")
+        exit()
+
+    sidebar_md = response.text
+    print("Raw sidebar markdown:")
+    print(sidebar_md[:500], "..." if len(sidebar_md) > 500 else "")
+
+    # Regex: match any .md link inside parentheses
+    links = re.findall(r'\((.*?)\.md\)', sidebar_md)
+    # add '.md' back to matches, remove duplicates
+    links = sorted(set(link + ".md" for link in links))
+
+    print(f"✅ Found {len(links)} markdown files:")
+
+    for l in links:
+        print(" -", l)
+
+    os.makedirs(SAVE_DIR, exist_ok=True)
 
-print("\n🎉 Done downloading all markdown files.")
-	 
\ No newline at end of file
+    started = time.perf_counter()
+    counts = fetch_all(links)
+    print(f"\n🎉 Done in {time.perf_counter() - started:.1f}s: {counts['changed']} changed, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed.")
@@ -1,13 +1,26 @@
-from playwright.sync_api import sync_playwright
+import argparse
 import json
 import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 TOPIC_LIST_FILE = "filtered_topics.json"
 OUTPUT_DIR = "topic_posts"
 SCROLL_DELAY = 2
 
+# JSON mode: Discourse's /t/{id}.json API instead of a browser
+DISCOURSE_BASE_URL = os.environ.get("DISCOURSE_BASE_URL")  # default: scheme + host of each topic's link
+SCRAPE_WORKERS = int(os.environ.get("SCRAPE_WORKERS", "4"))
+POSTS_PER_REQUEST = 20  # Discourse's page size for /t/{id}/posts.json
+REQUEST_TIMEOUT = 30
+
 def ensure_output_dir():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
@@ -20,6 +33,31 @@ def load_cookies(context):
         context.add_cookies(cookies)
         print("✅ Loaded cookies.")
 
+def topic_output_path(topic_id):
+    return os.path.join(OUTPUT_DIR, f"{topic_id}.json")
+
+def save_topic_posts(topic, posts, last_posted_at=None):
+    output_path = topic_output_path(topic["id"])
+    data = {"topic": topic, "posts": posts}
+    if last_posted_at:
+        data["last_posted_at"] = last_posted_at
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def load_saved_topic(topic_id):
+    path = topic_output_path(topic_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# ===== BROWSER MODE =====
 def wait_for_all_posts_to_load(page):
     last_count = -1
     stable_rounds = 0
@@ -68,12 +106,9 @@ def scrape_posts_from_topic(page, topic):
 
     return posts
 
-def scrape_all_posts():
-    ensure_output_dir()
-
-    with open(TOPIC_LIST_FILE, "r", encoding="utf-8") as f:
-        topics = json.load(f)
-
+def scrape_all_posts_browser(topics):
+    # Only --mode browser needs playwright; the JSON path runs without it
+    from playwright.sync_api import sync_playwright
     with sync_playwright() as p:
         browser = p.chromium.launch_persistent_context(user_data_dir="user_data", headless=False)
         page = browser.new_page()
@@ -84,17 +119,156 @@ def scrape_all_posts():
         for topic in topics:
             try:
                 posts = scrape_posts_from_topic(page, topic)
-                output_path = os.path.join(OUTPUT_DIR, f"{topic['id']}.json")
-                with open(output_path, "w", encoding="utf-8") as f:
-                    json.dump({
-                        "topic": topic,
-                        "posts": posts
-                    }, f, indent=2)
+                output_path = save_topic_posts(topic, posts)
                 print(f"✅ Saved {len(posts)} posts to {output_path}")
             except Exception as e:
                 print(f"❌ Error scraping topic {topic['id']}: {e}")
 
         browser.close()
 
+# ===== JSON MODE =====
+class _TextExtractor(HTMLParser):
+    BLOCK_TAGS = {"p", "div", "br", "li", "pre", "blockquote", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def _break(self, tag):
+        if tag in self.BLOCK_TAGS and self.parts and not self.parts[-1].endswith("\n"):
+            self.parts.append("\n")
+
+    def handle_starttag(self, tag, attrs):
+        self._break(tag)
+
+    def handle_endtag(self, tag):
+        self._break(tag)
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+def html_to_text(html):
+    """
+    Plain text of a post's "cooked" HTML, close to what the browser's inner_text gives.
+    """
+    parser = _TextExtractor()
+    parser.feed(html or "")
+    parser.close()
+    lines = [line.strip() for line in "".join(parser.parts).splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def convert_post(post):
+    return {
+        "author": post.get("username") or "Unknown",
+        "timestamp": post.get("created_at") or "Unknown",
+        "is_reply": post.get("post_number") != 1,
+        "content": html_to_text(post.get("cooked")),
+        "post_id": post["id"],
+        "post_number": post.get("post_number")
+    }
+
+def make_session(workers=SCRAPE_WORKERS):
+    """
+    Pooled session shared by the worker threads; retries 429/5xx honouring Retry-After.
+    """
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept"] = "application/json"
+
+    if os.path.exists("cookies.json"):
+        with open("cookies.json", "r") as f:
+            for cookie in json.load(f):
+                session.cookies.set(cookie["name"], cookie["value"],
+                                    domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+        print("✅ Loaded cookies.")
+    return session
+
+def topic_base_url(topic):
+    if DISCOURSE_BASE_URL:
+        return DISCOURSE_BASE_URL.rstrip("/")
+    link = urlparse(topic["link"])
+    return f"{link.scheme}://{link.netloc}"
+
+def fetch_json(session, url, params=None):
+    r = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+def scrape_topic_json(session, topic):
+    """
+    Fetches one topic through the JSON API. Returns (status, total posts, new posts),
+    status being "unchanged" (last_posted_at matches the saved file), "updated" or "new".
+    Only posts missing from the saved file are downloaded.
+    """
+    base_url = topic_base_url(topic)
+    topic_id = topic["id"]
+    data = fetch_json(session, f"{base_url}/t/{topic_id}.json")
+    last_posted_at = data.get("last_posted_at")
+
+    saved = load_saved_topic(topic_id)
+    if saved and last_posted_at and saved.get("last_posted_at") == last_posted_at:
+        return "unchanged", len(saved["posts"]), 0
+
+    known = {}
+    if saved:
+        known = {post["post_id"]: post for post in saved["posts"] if "post_id" in post}
+
+    stream = data["post_stream"]["stream"]  # every post id, in order
+    fetched = {post["id"]: convert_post(post) for post in data["post_stream"]["posts"]}
+    missing = [post_id for post_id in stream if post_id not in known and post_id not in fetched]
+    for i in range(0, len(missing), POSTS_PER_REQUEST):
+        page = fetch_json(session, f"{base_url}/t/{topic_id}/posts.json",
+                          params={"post_ids[]": missing[i:i + POSTS_PER_REQUEST]})
+        for post in page["post_stream"]["posts"]:
+            fetched[post["id"]] = convert_post(post)
+
+    posts = [fetched.get(post_id) or known[post_id] for post_id in stream if post_id in fetched or post_id in known]
+    save_topic_posts(topic, posts, last_posted_at)
+    new_posts = sum(1 for post_id in stream if post_id not in known)
+    return ("updated" if saved else "new"), len(posts), new_posts
+
+def scrape_all_posts_json(topics, workers=SCRAPE_WORKERS):
+    session = make_session(workers)
+    counts = {"new": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scrape_topic_json, session, topic): topic for topic in topics}
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                status, total, new_posts = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ Error scraping topic {topic['id']}: {e}")
+                continue
+            counts[status] += 1
+            if status != "unchanged":
+                print(f"✅ {status.capitalize()} topic {topic['id']}: {total} posts ({new_posts} fetched)")
+
+    session.close()
+    print(f"📊 {len(topics)} topics in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+def scrape_all_posts(mode="json", workers=SCRAPE_WORKERS):
+    ensure_output_dir()
+
+    with open(TOPIC_LIST_FILE, "r", encoding="utf-8") as f:
+        topics = json.load(f)
+
+    if mode == "browser":
+        scrape_all_posts_browser(topics)
+    else:
+        scrape_all_posts_json(topics, workers)
+
 if __name__ == "__main__":
-    scrape_all_posts()
+    parser = argparse.ArgumentParser(description="Scrape the posts of every topic in filtered_topics.json")
+    parser.add_argument("--mode", choices=["json", "browser"], default="json",
+                        help="json: concurrent, incremental Discourse API fetch; browser: Playwright scrolling")
+    parser.add_argument("--workers", type=int, default=SCRAPE_WORKERS)
+    args = parser.parse_args()
+    scrape_all_posts(args.mode, args.workers)
@@ -1,13 +1,15 @@
 from pathlib import Path
 import re
 import json
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from chunk_pipeline import run_chunking, file_sha256, CHUNK_WORKERS
 
 # ------------------------------
 # CONFIG
 # ------------------------------
 MARKDOWN_DIR = "tds_content"         # Folder with your .md files
-CHUNK_OUTPUT_FILE = "chunks/tds_contentchunks.json"
+MANIFEST_FILE = Path(MARKDOWN_DIR) / "manifest.json"  # written by project1scraping.py
+CHUNK_OUTPUT_DIR = "chunks/tds_content"  # JSONL shards (see app/chunk_io.py)
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
 
@@ -17,20 +19,40 @@ CHUNK_OVERLAP = 100
 def remove_markdown_images(text):
     return re.sub(r'!\[.*?\]\(.*?\)', '', text)
 
+# ------------------------------
+# Change detection
+# ------------------------------
+def file_hashes(folder_path):
+    """
+    source -> sha256 of every .md file, taken from the fetch manifest when it
+    covers the file (no need to read it) and computed otherwise.
+    """
+    manifest = {}
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    hashes = {}
+    for file in sorted(Path(folder_path).glob("*.md")):
+        entry = manifest.get(file.name)
+        if entry and entry.get("sha256"):
+            hashes[file.name] = entry["sha256"]
+        else:
+            hashes[file.name] = file_sha256(file)
+    return hashes
+
 # ------------------------------
 # Load and Clean Markdown Files
 # ------------------------------
-def load_and_process_markdown_files(folder_path):
-    docs = []
-    for file in Path(folder_path).glob("*.md"):
-        with open(file, "r", encoding="utf-8") as f:
-            raw = f.read()
-        cleaned = remove_markdown_images(raw)
-        docs.append({
-            "source": file.name,
-            "text": cleaned
-        })
-    return docs
+def load_and_process_markdown_file(file):
+    file = Path(file)
+    with open(file, "r", encoding="utf-8") as f:
+        raw = f.read()
+    cleaned = remove_markdown_images(raw)
+    return {
+        "source": file.name,
+        "text": cleaned
+    }
 
 # ------------------------------
 # Chunking
@@ -56,15 +78,24 @@ def chunk_documents(docs):
             })
     return all_chunks
 
+def chunk_markdown_file(path):
+    """
+    Runs in a worker process: one markdown file in, its chunks out.
+    """
+    return chunk_documents([load_and_process_markdown_file(path)])
+
 # ------------------------------
 # MAIN
 # ------------------------------
 if __name__ == "__main__":
-    docs = load_and_process_markdown_files(MARKDOWN_DIR)
-    chunks = chunk_documents(docs)
+    hashes = file_hashes(MARKDOWN_DIR)
+    sources = [(name, str(Path(MARKDOWN_DIR) / name), sha) for name, sha in hashes.items()]
 
-    Path("chunks").mkdir(exist_ok=True)
-    with open(CHUNK_OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
+    # Only files whose content changed since the last run are read and split again
+    total, rechunked, reused = run_chunking(
+        sources, chunk_markdown_file, CHUNK_OUTPUT_DIR,
+        params={"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    )
 
-    print(f"✅ Chunked {len(docs)} markdown files into {len(chunks)} clean chunks (images stripped).")
+    print(f"✅ Chunked {len(sources)} markdown files into {total} clean chunks (images stripped) in {CHUNK_OUTPUT_DIR}; "
+          f"{rechunked} re-chunked, {reused} unchanged ({CHUNK_WORKERS} workers).")
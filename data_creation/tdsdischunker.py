@@ -1,17 +1,18 @@
 import json
 from pathlib import Path
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 import re
+from chunk_pipeline import run_chunking, file_sha256, CHUNK_WORKERS
 
 # CONFIG
 TOPIC_POSTS_DIR = "topic_posts"
-OUTPUT_FILE = "chunks/discourse_chunks.json"
+OUTPUT_DIR = "chunks/discourse"  # JSONL shards (see app/chunk_io.py)
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
 
-def load_topic_post_files(folder_path):
-    files = list(Path(folder_path).glob("*.json"))
-    return [json.load(open(file, "r", encoding="utf-8")) for file in files]
+def load_topic_post_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 def format_post(post):
     author = post.get("author", "Unknown")
@@ -61,45 +62,21 @@ def chunk_topic_texts(topics_data):
 
     return all_chunks
 
+def chunk_topic_file(path):
+    """
+    Runs in a worker process: one topic_posts/<id>.json in, its chunks out.
+    """
+    return chunk_topic_texts([load_topic_post_file(path)])
+
 if __name__ == "__main__":
     Path("chunks").mkdir(exist_ok=True)
-    topic_files = load_topic_post_files(TOPIC_POSTS_DIR)
-    chunks = chunk_topic_texts(topic_files)
-
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
-
-    print(f"✅ Chunked {len(topic_files)} topics into {len(chunks)} chunks.")
-
+    topic_files = sorted(Path(TOPIC_POSTS_DIR).glob("*.json"))
+    sources = [(file.name, str(file), file_sha256(file)) for file in topic_files]
 
+    total, rechunked, reused = run_chunking(
+        sources, chunk_topic_file, OUTPUT_DIR,
+        params={"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    )
 
-  - vars:
-      question: If a student scores 10/10 on GA4 as well as a bonus, how would it appear on the dashboard?
-      link: https://discourse.onlinedegree.iitm.ac.in/t/ga4-data-sourcing-discussion-thread-tds-jan-2025/165959/388
-    assert:
-      - type: contains
-        transform: output.answer
-        value: 110
-      - type: contains
-        transform: JSON.stringify(output.links)
-        value: https://discourse.onlinedegree.iitm.ac.in/t/ga4-data-sourcing-discussion-thread-tds-jan-2025/165959
-
-  - vars:
-      question: I know Docker but have not used Podman before. Should I use Docker for this course?
-    assert:
-      - type: contains
-        transform: output.answer
-        value: Podman
-      - type: contains
-        transform: output.answer
-        value: Docker
-      - type: contains
-        transform: JSON.stringify(output.links)
-        value: https://tds.s-anand.net/#/docker
-
-  - vars:
-      question: When is the TDS Sep 2025 end-term exam?
-    assert:
-      - type: contains
-        transform: output.answer
-        value: doesn't know
\ No newline at end of file
+    print(f"✅ Chunked {len(topic_files)} topics into {total} chunks in {OUTPUT_DIR}; "
+          f"{rechunked} re-chunked, {reused} unchanged ({CHUNK_WORKERS} workers).")
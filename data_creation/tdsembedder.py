@@ -1,72 +1,201 @@
+import asyncio
 import json
 import os
+import sys
+import time
 import numpy as np
 import faiss
-from tqdm import tqdm
-from langchain_nomic import NomicEmbeddings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.metadata_store import write_metadata_store
+from app.ann_index import build_index, save_index, load_params, index_ids
+from app.bm25 import BM25Index, bm25_document
+from app.chunk_io import iter_chunks, resolve_chunks_path
+from embedding_store import EmbeddingStore, content_key, stable_id
+from embed_scheduler import EmbedScheduler, NomicBatchEmbedder
+from chunk_pipeline import file_sha256
 
 # === Paths ===
-DISCOURSE_PATH = "chunks/discourse_chunks.json"
-CONTENT_PATH = "chunks/tds_contentchunks.json"
+# JSONL shard directories written by the chunkers (legacy .json arrays still work)
+DISCOURSE_PATH = resolve_chunks_path("chunks/discourse", "chunks/discourse_chunks.json")
+CONTENT_PATH = resolve_chunks_path("chunks/tds_content", "chunks/tds_contentchunks.json")
 OUTPUT_INDEX = "vectorstore/tds_index.faiss"
 OUTPUT_META = "vectorstore/tds_metadata.json"
+OUTPUT_META_STORE = "vectorstore/tds_metadata.bin"  # mmap-able copy the API server reads
+OUTPUT_BM25 = "vectorstore/tds_bm25.npz"  # lexical index, same row order as the FAISS index
+OUTPUT_VERSION = "vectorstore/tds_version.json"  # written last; the API server reloads when it changes
+EMBED_STORE = "vectorstore/tds_embeddings.sqlite"  # content-addressed cache of every chunk embedding
 os.makedirs("vectorstore", exist_ok=True)
 
+# === Index type: flat | ivfflat | ivfpq | hnsw (see app/ann_index.py) ===
+# Extra build params as JSON, e.g. INDEX_PARAMS='{"nlist": 64, "nprobe": 8}'
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat")
+INDEX_PARAMS = json.loads(os.environ.get("INDEX_PARAMS", "{}"))
+REBUILD_INDEX = os.environ.get("REBUILD_INDEX", "0") == "1"  # ignore the existing index
+
 # === Initialize Embedder ===
 EMBED_MODEL = "nomic-embed-text-v1.5"
 DIMENSIONALITY = 256  # Must match what you use in API
 
-embedder = NomicEmbeddings(
-    model=EMBED_MODEL,
-    dimensionality=DIMENSIONALITY,
-    nomic_api_key=os.environ.get("NOMIC_API_KEY", "")  # Set in environment
-)
+# Batches in flight start at EMBED_CONCURRENCY and adapt to 429s/latency up to EMBED_MAX_CONCURRENCY
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_CONCURRENCY = int(os.environ.get("EMBED_MAX_CONCURRENCY", "16"))
+
+# "nomic" calls the API; "local" runs the same model on CPU (app/local_embedder.py).
+# The vectors are close but not identical (the local export may be quantized; see
+# benchmarks/embed_parity.py), so EMBED_MODEL_KEY keeps them apart: in the store
+# keys and in the index params, so switching backends re-embeds and rebuilds.
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "nomic")
+
+if EMBED_BACKEND == "local":
+    from app.local_embedder import LocalEmbedder, LocalBatchEmbedder
+    local_embedder = LocalEmbedder(dimensionality=DIMENSIONALITY)
+    embedder = LocalBatchEmbedder(local_embedder, task_type="search_document")
+    EMBED_MODEL_KEY = (f"{EMBED_MODEL}|local|{os.path.basename(local_embedder.model_path)}"
+                       f"|{file_sha256(local_embedder.model_path)[:16]}")
+    # One forward pass at a time; onnxruntime already uses every core for it
+    EMBED_CONCURRENCY = EMBED_MAX_CONCURRENCY = 1
+else:
+    embedder = NomicBatchEmbedder(
+        model=EMBED_MODEL,
+        dimensionality=DIMENSIONALITY,
+        api_key=os.environ.get("NOMIC_API_KEY", "")  # Set in environment
+    )
+    EMBED_MODEL_KEY = EMBED_MODEL  # what the store keys always used for the API
 
 # === Load & Normalize ===
 all_texts = []
 all_metadata = []
 
 def load_data(path, data_type):
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        for entry in data:
-            all_texts.append(entry['text'])
-            meta = {
-                "type": data_type,
-                "text": entry["text"],
-                "url": entry.get("url", ""),
-                "chunk_id": entry.get("chunk_id", -1)
-            }
-            if data_type == "discourse":
-                meta["title"] = entry.get("title", "")
-            else:
-                meta["source"] = entry.get("source", "")
-            all_metadata.append(meta)
+    for entry in iter_chunks(path):  # streamed, one chunk at a time
+        all_texts.append(entry['text'])
+        meta = {
+            "type": data_type,
+            "text": entry["text"],
+            "url": entry.get("url", ""),
+            "chunk_id": entry.get("chunk_id", -1)
+        }
+        if data_type == "discourse":
+            meta["title"] = entry.get("title", "")
+        else:
+            meta["source"] = entry.get("source", "")
+        all_metadata.append(meta)
 
 load_data(DISCOURSE_PATH, "discourse")
 load_data(CONTENT_PATH, "content")
 
-# === Generate Embeddings ===
-print(f"🔍 Generating {DIMENSIONALITY}D embeddings for {len(all_texts)} chunks...")
+# === Content keys and stable row ids ===
+# Embeddings are keyed by text (+ backend/model/dim); FAISS rows by chunk identity
+# + text, so an unchanged chunk keeps its id across runs.
+keys = [content_key(text, EMBED_MODEL_KEY, DIMENSIONALITY) for text in all_texts]
+row_ids = []
+seen_ids = set()
+for meta in all_metadata:
+    row_id = stable_id(meta["type"], meta["url"], meta["chunk_id"], meta["text"])
+    n = 1
+    while row_id in seen_ids:  # identical duplicate chunk
+        row_id = stable_id(meta["type"], meta["url"], meta["chunk_id"], meta["text"], n)
+        n += 1
+    seen_ids.add(row_id)
+    row_ids.append(row_id)
 
-# Batch process embeddings with progress bar
+# === Generate Embeddings (only for new or changed texts) ===
+store = EmbeddingStore(EMBED_STORE)
+stored = store.get_many(set(keys))
+to_embed = {}
+for key, text in zip(keys, all_texts):
+    if key not in stored:
+        to_embed.setdefault(key, text)
+
+print(f"🔍 {len(all_texts)} chunks: {len(all_texts) - len(to_embed)} reused, {len(to_embed)} to embed ({DIMENSIONALITY}D)")
+
+# Several batches in flight; each finished batch is committed to the store right
+# away, so rerunning after a crash only embeds what is still missing
 batch_size = 32
-embeddings = []
-for i in tqdm(range(0, len(all_texts), batch_size), desc="Embedding"):
-    batch = all_texts[i:i+batch_size]
-    embeddings.extend(embedder.embed_documents(batch))
+pending = list(to_embed.items())
+batches = [
+    ([key for key, _ in pending[i:i+batch_size]], [text for _, text in pending[i:i+batch_size]])
+    for i in range(0, len(pending), batch_size)
+]
+
+def on_batch_done(batch_keys, vectors):
+    store.put_many(batch_keys, vectors)
+    stored.update({key: np.asarray(vec, dtype="float32") for key, vec in zip(batch_keys, vectors)})
 
-# === Create FAISS Index ===
-dim = len(embeddings[0])  # Should match DIMENSIONALITY
+async def embed_pending():
+    scheduler = EmbedScheduler(embedder, initial_concurrency=EMBED_CONCURRENCY, max_concurrency=EMBED_MAX_CONCURRENCY)
+    try:
+        return await scheduler.run(batches, on_batch_done)
+    finally:
+        await embedder.aclose()
+
+if batches:
+    stats = asyncio.run(embed_pending())
+    print(f"⚡ Embedded {stats['texts']} texts in {stats['seconds']:.1f}s "
+          f"({stats['texts_per_second']:.1f} texts/s, {stats['retries']} retries, "
+          f"{stats['rate_limited']} rate limited, final concurrency {stats['final_concurrency']})")
+    if stats["failed_batches"]:
+        sys.exit(f"❌ {stats['failed_batches']} batches failed; finished batches are saved, rerun to resume")
+
+embeddings = np.stack([stored[key] for key in keys])
+
+# === Create / Update FAISS Index ===
+dim = embeddings.shape[1]  # Should match DIMENSIONALITY
 assert dim == DIMENSIONALITY, f"Embedding dim mismatch: {dim} vs {DIMENSIONALITY}"
 
-index = faiss.IndexFlatL2(dim)
-index.add(np.array(embeddings, dtype="float32"))
+def load_updatable_index():
+    """
+    The previous index, if it can be updated in place: same type and dim,
+    ID-mapped, built from the same embedding backend and model, and not HNSW
+    (which cannot remove vectors).
+    """
+    if REBUILD_INDEX or not os.path.exists(OUTPUT_INDEX):
+        return None, None
+    params = load_params(OUTPUT_INDEX)
+    if (params.get("index_type") != INDEX_TYPE or INDEX_TYPE == "hnsw"
+            or params.get("dim") != dim or not params.get("id_mapped")
+            or params.get("embed_model", EMBED_MODEL) != EMBED_MODEL_KEY):
+        return None, None
+    return faiss.read_index(OUTPUT_INDEX), params
+
+index, index_params = load_updatable_index()
+if index is not None:
+    old_ids = set(index_ids(index).tolist())
+    new_ids = set(row_ids)
+    removed = np.array(sorted(old_ids - new_ids), dtype="int64")
+    added = [i for i, row_id in enumerate(row_ids) if row_id not in old_ids]
+    if len(removed):
+        index.remove_ids(removed)
+    if added:
+        index.add_with_ids(embeddings[added], np.array([row_ids[i] for i in added], dtype="int64"))
+    index_params["ntotal"] = index.ntotal
+    print(f"♻️ Updated index in place: +{len(added)} / -{len(removed)} vectors")
+else:
+    index, index_params = build_index(embeddings, INDEX_TYPE, ids=row_ids, **INDEX_PARAMS)
+    print(f"🏗️ Built new {INDEX_TYPE} index with {index.ntotal} vectors")
 
 # === Save Outputs ===
-faiss.write_index(index, OUTPUT_INDEX)
+index_params["embed_model"] = EMBED_MODEL_KEY
+save_index(index, OUTPUT_INDEX, index_params)
 with open(OUTPUT_META, "w", encoding="utf-8") as f:
     json.dump(all_metadata, f, indent=2)
+write_metadata_store(OUTPUT_META_STORE, all_metadata, ids=row_ids)
+
+# Forget embeddings of chunks that no longer exist
+pruned = store.prune(keys)
+store.close()
+print(f"🧹 Dropped {pruned} stale embeddings from {EMBED_STORE}")
+
+bm25 = BM25Index.build([bm25_document(meta) for meta in all_metadata])
+bm25.save(OUTPUT_BM25)
+
+# Written after every other file, so a server never sees a half-written build
+with open(OUTPUT_VERSION + ".tmp", "w", encoding="utf-8") as f:
+    json.dump({"built_at": time.time(), "rows": len(all_metadata), "embed_model": EMBED_MODEL_KEY}, f)
+os.replace(OUTPUT_VERSION + ".tmp", OUTPUT_VERSION)
 
-print(f"✅ FAISS index ({dim}D) saved to {OUTPUT_INDEX}")
-print(f"📎 Metadata saved to {OUTPUT_META}")
+print(f"✅ FAISS {INDEX_TYPE} index ({dim}D) saved to {OUTPUT_INDEX}")
+print(f"📎 Metadata saved to {OUTPUT_META} and {OUTPUT_META_STORE}")
+print(f"🔤 BM25 index ({len(bm25.vocab)} terms) saved to {OUTPUT_BM25}")
+print(f"🏷️ Build version written to {OUTPUT_VERSION}")
@@ -0,0 +1,165 @@
+"""
+Local mock of the Discourse JSON endpoints used by data_creation/scrapefromtopic.py.
+
+    python stubs/discourse_stub.py --port 8102 --topics 50 --posts 30 --latency 0.05
+    curl -s http://127.0.0.1:8102/topics.json > filtered_topics.json
+    DISCOURSE_BASE_URL=http://127.0.0.1:8102 python data_creation/scrapefromtopic.py
+
+Endpoints:
+    GET  /topics.json                     topic list in filtered_topics.json format
+    GET  /t/{id}.json                     topic with the first page of posts + full post stream
+    GET  /t/{id}/posts.json?post_ids[]=   the requested posts
+    POST /t/{id}/posts.json               appends a post (bumps last_posted_at)
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from nomic_stub import add_stub_args
+
+PAGE_SIZE = 20
+FIRST_TOPIC_ID = 160000
+EPOCH = datetime(2025, 1, 2, tzinfo=timezone.utc)
+
+class Forum:
+    def __init__(self, topics=20, posts=30, base_url=""):
+        self.base_url = base_url
+        self.topics = {}
+        self.lock = threading.Lock()
+        for i in range(topics):
+            topic_id = FIRST_TOPIC_ID + i
+            self.topics[topic_id] = {"title": f"Mock topic {i}", "posts": []}
+            for _ in range(1 + (i * 7) % posts):
+                self._add_post(topic_id)
+
+    def _add_post(self, topic_id, text=None):
+        posts = self.topics[topic_id]["posts"]
+        number = len(posts) + 1
+        if text is None:
+            created = EPOCH + timedelta(days=topic_id - FIRST_TOPIC_ID, minutes=number)
+        else:
+            created = datetime.now(timezone.utc)  # posted through the API
+        post = {
+            "id": topic_id * 1000 + number,
+            "post_number": number,
+            "username": f"user{(topic_id + number) % 17}",
+            "created_at": created.isoformat().replace("+00:00", "Z"),
+            "cooked": f"<p>{text or f'Post {number} of topic {topic_id}.'}</p><ul><li>point a</li><li>point b</li></ul>"
+        }
+        posts.append(post)
+        return post
+
+    def add_post(self, topic_id, text):
+        with self.lock:
+            return self._add_post(topic_id, text)
+
+    def topic_list(self):
+        return [{
+            "id": str(topic_id),
+            "title": topic["title"],
+            "link": f"{self.base_url}/t/mock-topic/{topic_id}",
+            "date": topic["posts"][0]["created_at"][:10]
+        } for topic_id, topic in self.topics.items()]
+
+    def topic_json(self, topic_id):
+        with self.lock:
+            posts = list(self.topics[topic_id]["posts"])
+        return {
+            "id": topic_id,
+            "title": self.topics[topic_id]["title"],
+            "posts_count": len(posts),
+            "last_posted_at": posts[-1]["created_at"],
+            "post_stream": {"posts": posts[:PAGE_SIZE], "stream": [post["id"] for post in posts]}
+        }
+
+    def posts_json(self, topic_id, post_ids):
+        with self.lock:
+            posts = [post for post in self.topics[topic_id]["posts"] if post["id"] in post_ids]
+        return {"post_stream": {"posts": posts}, "id": topic_id}
+
+class StubState:
+    def __init__(self, forum, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.forum = forum
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _topic_id(self, path):
+            match = re.fullmatch(r"/t/(\d+)(\.json|/posts\.json)", path)
+            if not match or int(match.group(1)) not in state.forum.topics:
+                return None, None
+            return int(match.group(1)), match.group(2)
+
+        def do_GET(self):
+            with state.lock:
+                state.requests += 1
+            time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+            if random.random() < state.error_rate:
+                return self._send(503, {"errors": ["injected error"]})
+
+            url = urlparse(self.path)
+            if url.path == "/topics.json":
+                return self._send(200, state.forum.topic_list())
+            if url.path == "/stats.json":
+                return self._send(200, {"requests": state.requests})
+            topic_id, kind = self._topic_id(url.path)
+            if topic_id is None:
+                return self._send(404, {"errors": ["not found"]})
+            if kind == ".json":
+                return self._send(200, state.forum.topic_json(topic_id))
+            post_ids = {int(v) for v in parse_qs(url.query).get("post_ids[]", [])}
+            self._send(200, state.forum.posts_json(topic_id, post_ids))
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            topic_id, kind = self._topic_id(urlparse(self.path).path)
+            if topic_id is None or kind != "/posts.json":
+                return self._send(404, {"errors": ["not found"]})
+            self._send(200, state.forum.add_post(topic_id, payload.get("raw", "New reply.")))
+
+    return Handler
+
+def serve(port=8102, host="127.0.0.1", topics=20, posts=30, **kwargs):
+    """
+    Starts the stub in a background thread; returns the server (call .shutdown()).
+    """
+    forum = Forum(topics, posts, base_url=f"http://{host}:{port}")
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(forum, **kwargs)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_args(parser, 8102)
+    parser.add_argument("--topics", type=int, default=20, help="number of topics")
+    parser.add_argument("--posts", type=int, default=30, help="max posts per topic")
+    args = parser.parse_args()
+    server = serve(args.port, args.host, topics=args.topics, posts=args.posts,
+                   latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"Discourse stub listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,135 @@
+"""
+Local stand-in for Groq's OpenAI-compatible chat completions API, for load
+testing the API server without network or token spend.
+
+    python stubs/groq_stub.py --port 8103 --latency 0.3 --token-delay 0.01 --error-rate 0.02
+    GROQ_API_URL=http://127.0.0.1:8103/openai/v1/chat/completions uvicorn app.main:app
+
+--latency is the time to the first token; every further token adds --token-delay.
+Both plain and "stream": true requests are supported.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from nomic_stub import add_stub_args
+
+WORDS = ("the course uses docker and podman for containers while graded assignments "
+         "are scored out of ten with bonus marks shown on the dashboard").split()
+
+class StubState:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0.0, token_delay=0.0, tokens=60):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.requests = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+def fake_tokens(user_msg, n):
+    rng = random.Random(user_msg)
+    return [rng.choice(WORDS) + " " for _ in range(n)]
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send(200, {"requests": state.requests, "in_flight": state.in_flight})
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+            try:
+                if random.random() < state.rate_limit:
+                    return self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+                time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+                if random.random() < state.error_rate:
+                    return self._send(503, {"error": {"message": "injected error"}})
+
+                user_msg = payload.get("messages", [{}])[-1].get("content", "")
+                tokens = fake_tokens(user_msg, min(state.tokens, payload.get("max_tokens") or state.tokens))
+                if payload.get("stream"):
+                    return self._stream(payload, tokens)
+                time.sleep(state.token_delay * max(0, len(tokens) - 1))
+                self._send(200, {
+                    "id": f"stub-{state.requests}",
+                    "object": "chat.completion",
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens).strip()}}],
+                    "usage": {"prompt_tokens": len(user_msg.split()), "completion_tokens": len(tokens)}
+                })
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _stream(self, payload, tokens):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_event(data):
+                body = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(body):X}\r\n".encode("ascii") + body + b"\r\n")
+                self.wfile.flush()
+
+            try:
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(state.token_delay)
+                    write_event(json.dumps({
+                        "object": "chat.completion.chunk",
+                        "model": payload.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                    }))
+                write_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client went away mid-stream
+
+    return Handler
+
+def serve(port=8103, host="127.0.0.1", **kwargs):
+    """
+    Starts the stub in a background thread; returns the server (call .shutdown()).
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(**kwargs)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_args(parser, 8103)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between generated tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer")
+    args = parser.parse_args()
+    server = serve(args.port, args.host, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   rate_limit=args.rate_limit, token_delay=args.token_delay, tokens=args.tokens)
+    print(f"Groq stub listening on http://{args.host}:{args.port}/openai/v1/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,107 @@
+"""
+Local stand-in for the Nomic text embedding API, for exercising the embedding
+scheduler (data_creation/embed_scheduler.py) and the API server without network.
+
+    python stubs/nomic_stub.py --port 8101 --latency 0.2 --rate-limit 0.1 --error-rate 0.05
+    NOMIC_API_URL=http://127.0.0.1:8101/v1/embedding/text python data_creation/tdsembedder.py
+
+Vectors are deterministic per (text, dimensionality) and L2-normalized.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+def fake_embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return (vec / np.linalg.norm(vec)).tolist()
+
+class StubState:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0.0, max_concurrency=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.max_concurrency = max_concurrency  # 0 = unlimited; above it -> 429
+        self.in_flight = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send(200, {"requests": state.requests, "in_flight": state.in_flight})
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+                overloaded = state.max_concurrency and state.in_flight > state.max_concurrency
+            try:
+                if overloaded or random.random() < state.rate_limit:
+                    return self._send(429, {"detail": "rate limited"}, {"Retry-After": "1"})
+                time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+                if random.random() < state.error_rate:
+                    return self._send(503, {"detail": "injected error"})
+                dim = int(payload.get("dimensionality") or 768)
+                texts = payload.get("texts", [])
+                self._send(200, {
+                    "embeddings": [fake_embedding(text, dim) for text in texts],
+                    "model": payload.get("model"),
+                    "usage": {"prompt_tokens": sum(len(t.split()) for t in texts)}
+                })
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+def serve(port=8101, host="127.0.0.1", **kwargs):
+    """
+    Starts the stub in a background thread; returns the server (call .shutdown()).
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(StubState(**kwargs)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_stub_args(parser, port):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_args(parser, 8101)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="answer 429 above this many in flight")
+    args = parser.parse_args()
+    server = serve(args.port, args.host, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   rate_limit=args.rate_limit, max_concurrency=args.max_concurrency)
+    print(f"Nomic stub listening on http://{args.host}:{args.port}/v1/embedding/text")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,67 @@
+import faiss
+import numpy as np
+from app import vector_search
+from app.answer_cache import AnswerCache
+
+def vector(seed, dim=8):
+    return np.random.default_rng(seed).standard_normal(dim).astype("float32")
+
+def test_version_change_clears_cache():
+    cache = AnswerCache(dim=8)
+    context = (("https://example.com/t/1", 0),)
+    cache.lookup(vector(1), context, version="v1")
+    cache.store(vector(1), context, "answer", version="v1")
+    assert cache.lookup(vector(1), context, version="v1") == "answer"
+
+    assert cache.lookup(vector(1), context, version="v2") is None
+    assert cache.stats()["size"] == 0
+
+def test_store_from_old_version_is_dropped():
+    cache = AnswerCache(dim=8)
+    context = (("https://example.com/t/1", 0),)
+    cache.lookup(vector(1), context, version="v2")
+    cache.store(vector(1), context, "stale answer", version="v1")
+    assert cache.lookup(vector(1), context, version="v2") is None
+
+def test_reload_if_changed(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "index.faiss")
+    meta_path = str(tmp_path / "meta.json")
+    monkeypatch.setattr(vector_search, "TEXT_INDEX", index_path)
+    monkeypatch.setattr(vector_search, "TEXT_METADATA", meta_path)
+    monkeypatch.setattr(vector_search, "TEXT_METADATA_STORE", str(tmp_path / "missing.bin"))
+    monkeypatch.setattr(vector_search, "BM25_INDEX", str(tmp_path / "missing.npz"))
+    version_path = tmp_path / "version.json"
+    monkeypatch.setattr(vector_search, "TEXT_VERSION_FILE", str(version_path))
+    monkeypatch.setitem(vector_search._loaded, "version", None)
+    for resource in (vector_search.index, vector_search.metadata):
+        resource.reset()
+
+    def build(n):
+        index = faiss.IndexFlatL2(8)
+        index.add(np.stack([vector(i) for i in range(n)]))
+        faiss.write_index(index, index_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            f.write("[" + ",".join('{"text": "t"}' for _ in range(n)) + "]")
+
+    build(2)
+    assert vector_search.index.get().ntotal == 2
+    first = vector_search.loaded_vectorstore_version()
+    assert not vector_search.reload_if_changed()
+
+    build(3)
+    assert vector_search.reload_if_changed()
+    assert vector_search.index.get().ntotal == 3
+    assert vector_search.loaded_vectorstore_version() != first
+
+    # With a version file, a build only counts once that file is rewritten
+    version_path.write_text('{"built_at": 1}')
+    assert vector_search.reload_if_changed()
+    assert vector_search.index.get().ntotal == 3
+    build(4)
+    assert not vector_search.reload_if_changed()
+    version_path.write_text('{"built_at": 20}')
+    assert vector_search.reload_if_changed()
+    assert vector_search.index.get().ntotal == 4
+
+    for resource in (vector_search.index, vector_search.metadata):
+        resource.reset()
@@ -0,0 +1,66 @@
+import numpy as np
+from fastapi.testclient import TestClient
+from app import main
+
+HITS = [
+    {"url": "https://example.com/t/1", "chunk_id": 0, "title": "Topic 1", "text": "Use uv to create the environment"},
+    {"url": "https://example.com/t/1", "chunk_id": 4, "title": "Topic 1", "text": "Run the grader locally"},
+    {"url": "https://example.com/t/2", "chunk_id": 0, "title": "Topic 2", "text": "Deadlines are on the portal"},
+]
+
+def test_ask(monkeypatch):
+    calls = {}
+
+    async def embed_query(text):
+        calls["embed"] = text
+        return [0.1] * main.DIMENSIONALITY
+
+    def hybrid_search_batch(texts, embeddings, k=3):
+        calls["search"] = (texts, embeddings.shape)
+        return [HITS[:k]]
+
+    async def aquery_groq_mistral(system_msg, user_msg):
+        calls["user_msg"] = user_msg
+        return "Use uv."
+
+    monkeypatch.setattr(main, "embed_query", embed_query)
+    monkeypatch.setattr(main, "hybrid_search_batch", hybrid_search_batch)
+    monkeypatch.setattr(main, "aquery_groq_mistral", aquery_groq_mistral)
+    monkeypatch.setattr(main, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "VECTORSTORE_CHECK_SECONDS", 0)
+
+    # Not used as a context manager: the lifespan (warm-up, executor shutdown) stays out of it
+    response = TestClient(main.app).post("/ask", json={"question": "How do I set up Python?"})
+    assert response.status_code == 200
+    body = response.json()
+
+    assert body["answer"] == "Use uv."
+    assert body["links"] == [{"url": hit["url"], "text": hit["title"]} for hit in HITS]
+    assert "diagnostics" not in body
+    assert calls["embed"] == "How do I set up Python?"
+    assert calls["search"] == (["How do I set up Python?"], (1, main.DIMENSIONALITY))
+    assert calls["user_msg"].endswith("Query: How do I set up Python?")
+    for hit in HITS:
+        assert hit["text"] in calls["user_msg"]
+
+def test_ask_batch_reports_failed_items(monkeypatch):
+    async def embed_queries(texts):
+        return np.zeros((len(texts), main.DIMENSIONALITY))
+
+    async def aquery_groq_mistral(system_msg, user_msg):
+        if "broken" in user_msg:
+            raise RuntimeError("upstream error")
+        return "ok"
+
+    monkeypatch.setattr(main, "embed_queries", embed_queries)
+    monkeypatch.setattr(main, "hybrid_search_batch", lambda texts, embeddings, k=3: [HITS[:1] for _ in texts])
+    monkeypatch.setattr(main, "aquery_groq_mistral", aquery_groq_mistral)
+    monkeypatch.setattr(main, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "VECTORSTORE_CHECK_SECONDS", 0)
+
+    response = TestClient(main.app).post("/ask_batch", json={"questions": [{"question": "fine"}, {"question": "broken"}]})
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1]
+    assert results[0]["answer"] == "ok"
+    assert results[1]["error"] == "upstream error"
+    assert results[1]["links"] == [{"url": HITS[0]["url"], "text": HITS[0]["title"]}]
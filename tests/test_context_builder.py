@@ -0,0 +1,42 @@
+from app import context_builder
+from app.context_builder import select_chunks, join_overlapping, merge_passages, estimate_tokens, format_passage
+
+def chunk(url, chunk_id, text="x" * 40, title="Doc"):
+    return {"url": url, "chunk_id": chunk_id, "text": text, "title": title}
+
+def test_select_chunks_dedupes_and_orders():
+    hits = [chunk("a", 0), chunk("b", 3), chunk("a", 0)]
+    images = [chunk("b", 3), chunk("c", 0), chunk("c", 1), chunk("c", 2)]
+    selected = select_chunks(hits, images, budget=10_000, max_image_chunks=3)
+    assert [(c["url"], c["chunk_id"]) for c in selected] == [("a", 0), ("b", 3), ("c", 0), ("c", 1)]
+
+def test_select_chunks_keeps_to_budget():
+    cost = estimate_tokens(format_passage("Doc", "x" * 40))
+    hits = [chunk("a", i) for i in range(5)]
+    assert len(select_chunks(hits, [], budget=cost * 2)) == 2
+    # The first chunk always goes in, even over budget
+    assert len(select_chunks(hits, [], budget=1)) == 1
+
+def test_select_chunks_marks_neighbors():
+    def neighbors(hit, radius):
+        return [chunk(hit["url"], hit["chunk_id"] + d) for d in range(-radius, radius + 1) if d]
+
+    selected = select_chunks([chunk("a", 5), chunk("a", 6)], [], budget=10_000, neighbors=1, neighbor_fn=neighbors)
+    assert [(c["chunk_id"], bool(c.get("neighbor"))) for c in selected] == [(5, False), (6, False), (4, True), (7, True)]
+
+def test_join_overlapping():
+    first = "The quick brown fox jumps over"
+    assert join_overlapping(first, "fox jumps over the lazy dog") == "The quick brown fox jumps over the lazy dog"
+    assert join_overlapping("abc", "xyz") == "abc\nxyz"
+
+def test_merge_passages():
+    chunks = [
+        chunk("b", 0, "other"),
+        chunk("a", 2, "jumps over the lazy dog"),
+        chunk("a", 1, "The quick brown fox jumps over"),
+        chunk("a", 5, "far away"),
+    ]
+    passages = merge_passages(chunks)
+    assert [(p["url"], p["chunk_ids"]) for p in passages] == [("b", [0]), ("a", [1, 2]), ("a", [5])]
+    assert passages[1]["text"] == "The quick brown fox jumps over the lazy dog"
+    assert context_builder.format_context(passages[:1]) == "Title: Doc\nChunk: other"
@@ -0,0 +1,24 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_creation"))
+from embed_scheduler import EmbedScheduler
+
+def test_short_response_is_retried():
+    calls = []
+
+    async def embed_batch(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            return [[0.0]] * (len(texts) - 1)  # one embedding missing
+        return [[float(len(text))] for text in texts]
+
+    done = {}
+    scheduler = EmbedScheduler(embed_batch, base_delay=0, report_every=60)
+    batches = [(["a", "b"], ["x", "yy"]), (["c"], ["zzz"])]
+    stats = asyncio.run(scheduler.run(batches, lambda keys, vectors: done.update(zip(keys, vectors))))
+
+    assert done == {"a": [1.0], "b": [2.0], "c": [3.0]}
+    assert stats["retries"] == 1
+    assert stats["failed_batches"] == 0
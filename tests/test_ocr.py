@@ -0,0 +1,58 @@
+import os
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from app import ocr
+
+def text_image(lines=12, size=16):
+    image = Image.new("RGB", (1200, 40 + lines * int(size * 1.4)), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=size)
+    for i in range(lines):
+        draw.text((20, 20 + i * int(size * 1.4)), "import numpy as np  # the quick brown fox 42", font=font, fill="black")
+    return image
+
+def textured_photo(seed=0):
+    # Smooth shapes plus fine grain, like foliage or fabric: strong edges in every row
+    rng = np.random.default_rng(seed)
+    base = Image.fromarray(rng.integers(0, 256, (48, 64), dtype=np.uint8)).resize((1024, 768), Image.Resampling.BICUBIC)
+    grain = rng.normal(0, 25, (768, 1024))
+    return Image.fromarray(np.clip(np.asarray(base, dtype="float64") + grain, 0, 255).astype("uint8")).convert("RGB")
+
+def test_text_is_detected():
+    assert ocr.has_text(text_image())
+    assert ocr.has_text(text_image(lines=1, size=32))
+
+def test_uniform_noise_has_no_text():
+    noise = np.random.default_rng(1).integers(0, 256, (768, 1024, 3), dtype=np.uint8)
+    assert ocr.text_rows(Image.fromarray(noise)) < ocr.OCR_MIN_TEXT_ROWS
+
+def test_textured_photo_has_no_text():
+    assert not ocr.has_text(textured_photo())
+
+def test_text_free_image_skips_tesseract(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("tesseract should not run")
+    monkeypatch.setattr(ocr, "run_tesseract", fail)
+    result = ocr.extract_text(textured_photo())
+    assert result["status"] == "no_text"
+    assert result["size"] is None
+
+def fake_tesseract(tmp_path, body):
+    script = tmp_path / "tesseract"
+    script.write_text("#!/bin/sh\ncat > /dev/null\n" + body + "\n")
+    script.chmod(0o755)
+    return str(script)
+
+def test_thread_limit_only_reaches_tesseract(tmp_path, monkeypatch):
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+    monkeypatch.setattr(ocr, "TESSERACT_CMD", fake_tesseract(tmp_path, 'echo "threads=$OMP_THREAD_LIMIT"'))
+    text, status = ocr.run_tesseract(text_image(lines=1), timeout=5)
+    assert (text.strip(), status) == ("threads=1", "ok")
+    assert "OMP_THREAD_LIMIT" not in os.environ
+
+def test_slow_tesseract_times_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, "TESSERACT_CMD", fake_tesseract(tmp_path, "sleep 5"))
+    started = time.perf_counter()
+    assert ocr.run_tesseract(text_image(lines=1), timeout=0.5) == ("", "timeout")
+    assert time.perf_counter() - started < 2
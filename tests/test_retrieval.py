@@ -0,0 +1,106 @@
+import json
+import numpy as np
+from app import vector_search
+from app.bm25 import BM25Index, reciprocal_rank_fusion
+from app.chunk_io import ShardWriter, ChunkReader, iter_chunks, resolve_chunks_path, encode_chunk
+from app.metadata_store import MetadataStore, write_metadata_store, ids_path
+
+TEXTS = [
+    "Docker compose runs several containers",
+    "Install uv and create a virtual environment",
+    "Docker images and docker volumes",
+]
+
+def test_bm25_ranks_by_term_frequency():
+    bm25 = BM25Index.build(TEXTS)
+    rows, scores = bm25.search("docker", k=5)
+    assert list(rows) == [2, 0]
+    assert scores[0] > scores[1] > 0
+
+    rows, _ = bm25.search("kubernetes", k=5)
+    assert len(rows) == 0
+
+def test_bm25_save_load(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    BM25Index.build(TEXTS).save(path)
+    bm25 = BM25Index.load(path)
+    assert bm25.num_docs == 3
+    rows, _ = bm25.search("virtual environment", k=1)
+    assert list(rows) == [1]
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert fused == [1, 3, 2]
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60, limit=2) == [1, 3]
+
+def test_shards_round_trip(tmp_path):
+    chunks = [{"url": "u1", "chunk_id": i, "topic_id": "1", "text": f"t{i}"} for i in range(3)]
+    chunks.append({"url": "u2", "chunk_id": 0, "topic_id": "2", "text": "ü"})
+    out_dir = str(tmp_path / "shards")
+    writer = ShardWriter(out_dir, max_lines=2)
+    for url in ("u1", "u2"):
+        for chunk in chunks:
+            if chunk["url"] == url:
+                writer.write(chunk)
+        writer.end_group()
+    assert writer.close() == 4
+    # One source's chunks never straddle two shards
+    assert writer.shards == 2
+
+    assert resolve_chunks_path(out_dir, "missing.json") == out_dir
+    assert resolve_chunks_path(str(tmp_path / "empty"), "legacy.json") == "legacy.json"
+    assert list(iter_chunks(out_dir)) == chunks
+
+    reader = ChunkReader(out_dir)
+    refs = list(reader.refs())
+    assert [chunk for _, chunk in refs] == chunks
+    assert reader.read(refs[-1][0]) == chunks[-1]
+    reader.close()
+
+def test_legacy_json_chunks(tmp_path):
+    path = tmp_path / "chunks.json"
+    chunks = [{"url": "u1", "chunk_id": 0, "text": "a"}]
+    path.write_text(json.dumps(chunks))
+    assert list(iter_chunks(str(path))) == chunks
+    assert ChunkReader(str(path)).read(0) == chunks[0]
+
+def test_topic_index(tmp_path, monkeypatch):
+    out_dir = tmp_path / "chunks"
+    out_dir.mkdir()
+    chunks = [
+        {"url": "u1", "chunk_id": 0, "topic_id": 1, "text": "a"},
+        {"url": "u2", "chunk_id": 0, "topic_id": 2, "text": "b"},
+        {"url": "u1", "chunk_id": 1, "topic_id": 1, "text": "c"},
+    ]
+    (out_dir / "part-00000.jsonl").write_bytes(b"".join(encode_chunk(chunk) for chunk in chunks))
+    reader = ChunkReader(str(out_dir))
+    topics = vector_search.build_topic_index(reader)
+    assert {topic: len(refs) for topic, refs in topics.items()} == {"1": 2, "2": 1}
+
+    monkeypatch.setattr(vector_search.chunk_reader, "get", lambda: reader)
+    monkeypatch.setattr(vector_search.topic_index, "get", lambda: topics)
+    assert [c["text"] for c in vector_search.get_chunks_by_topic_ids(["2", 1, "2"])] == ["b", "a", "c"]
+    assert [c["text"] for c in vector_search.get_chunks_by_topic_ids([1], max_per_topic=1)] == ["a"]
+    reader.close()
+
+def test_metadata_store_round_trip(tmp_path):
+    path = str(tmp_path / "meta.bin")
+    rows = [{"url": "u1", "chunk_id": i, "text": f"t{i}"} for i in range(3)] + [{"url": "u2", "text": "no chunk id"}]
+    assert write_metadata_store(path, rows, ids=[40, 10, 30, 20]) == 4
+
+    store = MetadataStore(path)
+    assert len(store) == 4
+    assert list(store) == rows
+    assert store[-1] == rows[-1]
+    assert list(store.rows_for_labels([10, 20, 99, -1])) == [1, 3, -1, -1]
+    assert store.find_chunk("u1", 2) == rows[2]
+    assert store.find_chunk("u1", 5) is None
+    store.close()
+
+    # Rewritten without stable ids: the old ids file goes with it
+    write_metadata_store(path, rows[:2])
+    store = MetadataStore(path)
+    assert store.ids is None
+    assert list(store.rows_for_labels(np.array([1]))) == [1]
+    store.close()
+    assert not (tmp_path / ids_path("meta.bin")).exists()